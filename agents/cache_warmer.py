@@ -0,0 +1,208 @@
+# agents/cache_warmer.py
+"""
+Answer cache for the Data Access Agent and the background job that keeps it
+warm.
+
+Every answered question is logged under its fingerprint (the normalized
+message) with the SQL that answered it. Results are cached per fingerprint
+and tagged with the data version they were read at; a data change (a
+Customer Success write, or Postgres table counters moving after e.g. a
+`db/load_excel_to_dbs.py` reload) bumps the version and wakes the warmer.
+The warmer re-executes the stored SQL of the most frequent questions at
+background priority, within a time budget and without any LLM calls, so
+the first user after the change gets a cache hit.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import text
+
+from query.columnar import QueryResult
+from tools.scheduler import PRIORITIES, admit, db_gate, llm_gate
+
+ANSWER_CACHE_MAX = int(os.getenv("ANSWER_CACHE_MAX", "256"))
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", "900"))
+QUESTION_LOG_MAX = int(os.getenv("QUESTION_LOG_MAX", "5000"))
+WARMER_ENABLED = os.getenv("WARMER_ENABLED", "true").lower() == "true"
+WARMER_TOP_N = int(os.getenv("WARMER_TOP_N", "25"))
+WARMER_BUDGET_S = float(os.getenv("WARMER_BUDGET_S", "60"))
+WARMER_POLL_S = float(os.getenv("WARMER_POLL_S", "30"))
+# Also re-warm this often without a data change (0 = only after changes).
+WARMER_INTERVAL_S = float(os.getenv("WARMER_INTERVAL_S", "0"))
+
+SENDER = "cache-warmer"
+
+
+class QuestionLog:
+    """Fingerprint -> {question, sql, count, last_at}; least recently asked evicted first. Thread-safe."""
+    def __init__(self, max_entries: int = QUESTION_LOG_MAX):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._by_fp: "OrderedDict[str, dict]" = OrderedDict()
+
+    def record(self, fp: str, question: str, sql: str):
+        with self._lock:
+            e = self._by_fp.pop(fp, None) or {"count": 0}
+            e.update(question=question, sql=sql, last_at=time.time())
+            e["count"] += 1
+            self._by_fp[fp] = e
+            if len(self._by_fp) > self.max_entries:
+                self._by_fp.popitem(last=False)
+
+    def top(self, n: int) -> list[tuple[str, dict]]:
+        with self._lock:
+            items = [(fp, dict(e)) for fp, e in self._by_fp.items()]
+        items.sort(key=lambda kv: kv[1]["count"], reverse=True)
+        return items[:n]
+
+    def __len__(self):
+        return len(self._by_fp)
+
+
+class AnswerCache:
+    """Fingerprint -> QueryResult, valid for the data version it was read at (and ANSWER_CACHE_TTL_S)."""
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX, ttl_s: float = ANSWER_CACHE_TTL_S):
+        self.max_entries, self.ttl_s = max_entries, ttl_s
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # fp -> (result, version, stored_at)
+        self.version = 0
+        self.hits = self.misses = 0
+
+    def invalidate(self):
+        """Data changed: everything cached so far is stale."""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def fresh(self, fp: str) -> bool:
+        with self._lock:
+            e = self._entries.get(fp)
+            return e is not None and e[1] == self.version and time.time() - e[2] < self.ttl_s
+
+    def get(self, fp: str) -> QueryResult | None:
+        with self._lock:
+            e = self._entries.get(fp)
+            if e is None or e[1] != self.version or time.time() - e[2] >= self.ttl_s:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(fp)
+            self.hits += 1
+            return e[0]
+
+    def put(self, fp: str, result: QueryResult, version: int):
+        """Store `result` read at `version` (taken before executing, so a change mid-query isn't cached)."""
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[fp] = (result, version, time.time())
+            self._entries.move_to_end(fp)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "version": self.version, "hits": self.hits, "misses": self.misses}
+
+
+def _interactive_waiting() -> bool:
+    return any(g.stats()[PRIORITIES[0]]["queued"] for g in (llm_gate, db_gate))
+
+
+class CacheWarmer:
+    """Re-executes the top logged questions' SQL into the answer cache after data changes."""
+    def __init__(self, da, top_n: int = WARMER_TOP_N, budget_s: float = WARMER_BUDGET_S):
+        self.da = da
+        self.top_n, self.budget_s = top_n, budget_s
+        self._wake = threading.Event()
+        self._counters = None
+        self._poll_error = None
+        self._thread = None
+        self.runs = 0
+        self.last_run: dict = {}
+
+    def notify_change(self):
+        """Called after in-process writes: drop stale answers now and re-warm soon."""
+        self.da.answers.invalidate()
+        self._wake.set()
+
+    def _poll_changed(self) -> bool:
+        # Postgres table counters move on every insert/update/delete, from any client.
+        try:
+            from query.engines import get_engine
+            with db_gate.slot(priority="background", sender=SENDER), get_engine("postgres").connect() as c:
+                rows = c.execute(text("SELECT relid, n_tup_ins, n_tup_upd, n_tup_del FROM pg_stat_user_tables")).fetchall()
+        except Exception as e:
+            if self._poll_error is None:  # say it once, not every poll
+                print(f"[cache-warmer] change poll failed: {type(e).__name__}: {e}")
+            self._poll_error = str(e)
+            return False
+        self._poll_error = None
+        counters = sorted(tuple(r) for r in rows)
+        changed = self._counters is not None and counters != self._counters
+        self._counters = counters
+        return changed
+
+    def run_once(self) -> dict:
+        """One warm pass over the most frequent questions, stopping at the budget or when users are waiting."""
+        t0 = time.perf_counter()
+        out = {"warmed": 0, "fresh": 0, "failed": 0, "stopped": None}
+        with admit("background", SENDER):
+            for fp, e in self.da.log.top(self.top_n):
+                if time.perf_counter() - t0 >= self.budget_s:
+                    out["stopped"] = "budget"
+                    break
+                if _interactive_waiting():
+                    out["stopped"] = "interactive traffic"
+                    break
+                if self.da.answers.fresh(fp):
+                    out["fresh"] += 1
+                    continue
+                version = self.da.answers.version
+                try:
+                    # Postgres, not the replica: right after a change the replica may not have
+                    # refreshed yet, and its rows would be cached under the new version.
+                    df = self.da._execute(e["sql"], replica=False)
+                except Exception as ex:
+                    out["failed"] += 1
+                    print(f"[cache-warmer] {e['question']!r}: {type(ex).__name__}: {ex}")
+                    continue
+                self.da.answers.put(fp, QueryResult(df, sql=e["sql"]), version)
+                out["warmed"] += 1
+        out["elapsed_s"] = round(time.perf_counter() - t0, 3)
+        self.runs += 1
+        self.last_run = dict(out, at=time.time())
+        return out
+
+    def _loop(self):
+        last = time.monotonic()
+        self._poll_changed()  # baseline
+        while True:
+            woke = self._wake.wait(WARMER_POLL_S)
+            self._wake.clear()
+            changed = self._poll_changed()
+            if changed:
+                self.da.answers.invalidate()
+            due = WARMER_INTERVAL_S > 0 and time.monotonic() - last >= WARMER_INTERVAL_S
+            if WARMER_ENABLED and (woke or changed or due):
+                try:
+                    print("[cache-warmer]", self.run_once())
+                except Exception as e:
+                    print(f"[cache-warmer] run failed: {type(e).__name__}: {e}")
+                last = time.monotonic()
+
+    def start(self) -> threading.Thread | None:
+        # The change poll is the only way external writes invalidate the answer cache, so the
+        # thread runs whenever the cache is on; WARMER_ENABLED only controls re-warming.
+        if not (WARMER_ENABLED or ANSWER_CACHE_MAX > 0) or self._thread is not None:
+            return self._thread
+        self._thread = threading.Thread(target=self._loop, name="cache-warmer", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stats(self) -> dict:
+        return {"enabled": WARMER_ENABLED, "running": self._thread is not None, "runs": self.runs,
+                "last_run": self.last_run, "logged_questions": len(self.da.log),
+                "answer_cache": self.da.answers.stats(), "poll_error": self._poll_error}
@@ -1,16 +1,11 @@
-from agno.agent import Agent
-#from agno.models.ollama import Ollama
-from agno.models.google import Gemini
-from sqlalchemy import create_engine, text
-from dotenv import load_dotenv
+from sqlalchemy import text
 from agents.json_utils import loads_relaxed
+from agents.models import LazyAgent
+from query.engines import engine_for
+from query.replica import note_write
 import os, json
 from tools.safety import guard_write
-
-load_dotenv()
-
-PG = create_engine(os.getenv("POSTGRES_URL"), future=True)
-MY = create_engine(os.getenv("MYSQL_URL"), future=True)
+from tools.scheduler import db_gate
 
 SYSTEM = """
 You are the Customer Success Agent.
@@ -66,8 +61,7 @@ def normalize_returns_insert(sql: str, params: dict):
 
 class CustomerSuccessAgent:
     def __init__(self, model_id: str, host: str):
-        #self.agent = Agent(model=Ollama(id=model_id, host=host), system_message=SYSTEM, markdown=False)
-        self.agent = Agent(model=Gemini(id=model_id), system_message=SYSTEM, markdown=False)
+        self.agent = LazyAgent(SYSTEM, model_id=model_id, task="write")
 
     # def act(self, user_request: str, confirmed: bool=False):
     #     plan = self.agent.run(user_request + "\nRespond JSON ONLY.").content
@@ -77,7 +71,7 @@ class CustomerSuccessAgent:
     #     if not ok:
     #         return msg
 
-    #     eng = PG if data["engine"]=="postgres" else MY
+    #     eng = engine_for(data["engine"])
     #     with eng.begin() as c:
     #         c.execute(text(data["sql"]), data.get("params", {}))
     #     return f"SUCCESS: {data['operation']} executed.\nHint: {data.get('confirmation_hint','')}"
@@ -90,23 +84,26 @@ class CustomerSuccessAgent:
         if not ok:
             return msg
 
-        eng = PG if data["engine"]=="postgres" else MY
+        eng = engine_for(data["engine"])
         sql = data["sql"]
         params = data.get("params", {})
 
         # Normalize returns inserts and make idempotent
         if data["operation"] == "insert" and "ref.returns" in sql.lower():
             sql, params, changed = normalize_returns_insert(sql, params)
-            with eng.begin() as c:
+            with db_gate.slot(), eng.begin() as c:
                 # idempotent: clear any earlier return for this order
                 if "order_id" in params:
                     c.execute(text('DELETE FROM ref.returns WHERE "ID"=:order_id'), {"order_id": params["order_id"]})
                 c.execute(text(sql), params)
+            note_write(sql)
             return f"SUCCESS: return recorded for order {params.get('order_id','(unknown)')}."
 
         # Default path
-        with eng.begin() as c:
+        with db_gate.slot(), eng.begin() as c:
             c.execute(text(sql), params)
+        if data["engine"] == "postgres":
+            note_write(sql)  # the replica would serve pre-write rows until its next refresh
         return f"SUCCESS: {data['operation']} executed.\nHint: {data.get('confirmation_hint','')}"
 
 
@@ -3,12 +3,18 @@ from __future__ import annotations
 
 import os
 import re
-from typing import Dict, List
-
-from agno.agent import Agent
-from agno.models.google import Gemini
-from graph.graph_store import GraphStore
-from query.federation import run_sql, summarize
+from typing import Dict, List, Tuple
+
+from agents.cache_warmer import AnswerCache, QuestionLog
+from agents.models import LazyAgent
+from agents.plan_index import PlanIndex
+from graph.graph_store import GraphStore, get_graph_store
+from query.columnar import QueryResult
+from query.federation import run_sql
+from query.governor import QueryCancelled, QueryRejected
+from query.parameterize import parameterize
+from tools.scheduler import Overloaded
+from tools.singleflight import SingleFlight, normalize_message
 from sqlalchemy.exc import ProgrammingError, ResourceClosedError
 
 
@@ -77,6 +83,9 @@ def pick_resultset_statement(sql_block: str) -> str | None:
 # Knowledge-graph–aware normalizers (light)
 # ==========================================
 
+# The read path only ever targets Postgres; MySQL tables in the KG are ignored here.
+ENGINE = "postgres"
+
 def _basename(name: str) -> str:
     return (name or "").replace('"', "").split(".")[-1].lower()
 
@@ -85,7 +94,7 @@ def soft_remap_known_tables_to_graph(sql: str, gs: GraphStore) -> str:
     Remap FROM/JOIN object names to the actual FQNs in the graph by basename,
     e.g., synthetic_store.regional_managers -> ref.regional_managers.
     """
-    idx = { _basename(t): t for t in gs.tables() }
+    idx = { _basename(t): t for t in gs.tables(ENGINE) }
 
     def repl(m):
         kw, obj = m.group("kw"), m.group("obj")
@@ -107,10 +116,10 @@ def _alias_to_table(sql: str) -> Dict[str, str]:
 
 def _resolve_fqn(gs: GraphStore, obj: str) -> str | None:
     obj_clean = obj.replace('"', "")
-    if obj_clean in gs.tables():
+    if obj_clean in gs.tables(ENGINE):
         return obj_clean
     base = _basename(obj_clean)
-    for t in gs.tables():
+    for t in gs.tables(ENGINE):
         if _basename(t) == base:
             return t
     return None
@@ -219,6 +228,86 @@ def normalize_sql_with_graph(sql: str, gs: GraphStore) -> str:
     sql = auto_quote_bare_known_cols(sql, gs)
     return sql
 
+_COL_EQ_RX = re.compile(
+    r'(?P<qa>(?:"[^"]+"|\w+)(?:\.(?:"[^"]+"|\w+))?)\."(?P<ca>[^"]+)"\s*=\s*'
+    r'(?P<qb>(?:"[^"]+"|\w+)(?:\.(?:"[^"]+"|\w+))?)\."(?P<cb>[^"]+)"'
+)
+
+def _resolve_qualifier(gs: GraphStore, alias_map: Dict[str, str], qual: str) -> str | None:
+    q = qual.replace('"', "")
+    return _resolve_fqn(gs, alias_map.get(q, q))
+
+def _kg_column_classes(gs: GraphStore, tables: List[str]):
+    """find() over (table, column): columns the KG join hints among `tables` make equal share a root."""
+    parent: Dict[tuple, tuple] = {}
+    def find(x):
+        while parent.get(x, x) != x:
+            parent[x] = parent.get(parent[x], parent[x])
+            x = parent[x]
+        return x
+    for i, ta in enumerate(tables):
+        for tb in tables[i + 1:]:
+            for ca, cb in gs.join_on(ta, tb) or []:
+                parent[find((ta, ca))] = find((tb, cb))
+    return find
+
+_FROM_ITEM_RX = re.compile(r'(?is)\b(?P<kw>from|cross\s+join|join)\s+(?P<obj>\(|(?:"[^"]+"|\w+)(?:\.(?:"[^"]+"|\w+))?)')
+
+def _kg_cross_joins(sql: str, gs: GraphStore) -> List[Tuple[str, str]]:
+    """
+    (left, right) KG base tables combined by CROSS JOIN. Subquery operands don't count:
+    `CROSS JOIN (SELECT SUM("Sales") AS total ...) t` is the usual one-row share pattern.
+    """
+    depth, depths = 0, []
+    for ch in sql:
+        depths.append(depth)
+        depth += (ch == "(") - (ch == ")")
+    items = [(m.start(), depths[m.start()], m.group("kw").lower().startswith("cross"),
+              None if m.group("obj") == "(" else _resolve_fqn(gs, m.group("obj")))
+             for m in _FROM_ITEM_RX.finditer(sql)]
+    out = []
+    for i, (_, d, cross, right) in enumerate(items):
+        if not cross or not right:
+            continue
+        left = next((t for _, d2, _, t in reversed(items[:i]) if d2 == d), None)  # previous item, same level
+        if left:
+            out.append((left, right))
+    return out
+
+def check_joins_with_graph(sql: str, gs: GraphStore) -> List[str]:
+    """
+    Local join validator: every column-to-column equality between two KG tables
+    must follow from the KG join hints among the statement's tables, directly or
+    through a chain (orders.Region = csm.Regions and orders.Region = rm.Regions
+    imply csm.Regions = rm.Regions). Returns issues (empty when fine), each
+    carrying the ready-made clause from the join index so the repair prompt can use it.
+    """
+    alias_map = _alias_to_table(sql)
+    issues: List[str] = []
+    for ta, tb in _kg_cross_joins(sql, gs):
+        issues.append(f"CROSS JOIN of {ta} and {tb} is not allowed; join tables only via the KG join clauses.")
+    eqs = []
+    for m in _COL_EQ_RX.finditer(sql):
+        ta = _resolve_qualifier(gs, alias_map, m.group("qa"))
+        tb = _resolve_qualifier(gs, alias_map, m.group("qb"))
+        if ta and tb and ta != tb:
+            eqs.append((ta, m.group("ca"), tb, m.group("cb")))
+    tables = sorted(set(_involved_tables(sql, gs)) | {t for ta, _, tb, _ in eqs for t in (ta, tb)})
+    same = _kg_column_classes(gs, tables)
+    for ta, ca, tb, cb in eqs:
+        if same((ta, ca)) == same((tb, cb)):
+            continue
+        on = gs.join_on(ta, tb)
+        clause = gs.join_clause([ta, tb])
+        if on:
+            expected = " AND ".join(f'"{a}" = "{b}"' for a, b in on)
+            issues.append(f'{ta} and {tb} are joined on "{ca}" = "{cb}", but the KG joins them on {expected}:\n{clause}')
+        elif clause:
+            issues.append(f"{ta} and {tb} have no direct join; connect them through the KG path:\n{clause}")
+        else:
+            issues.append(f"{ta} and {tb} are not joinable according to the KG.")
+    return list(dict.fromkeys(issues))
+
 def repair_from_hint(sql: str, err_msg: str) -> str | None:
     """
     Use Postgres' 'Perhaps you meant to reference the column "tbl.Col"' hint
@@ -239,23 +328,106 @@ def repair_from_hint(sql: str, err_msg: str) -> str | None:
 
 SYSTEM_MESSAGE = "You are a PostgreSQL 14+ specialist. Return only a single SQL query in a ```sql fenced block```."
 
+# Cosine similarity (0..1) a paraphrase needs to reuse a stored plan; > 1 disables reuse.
+PLAN_MATCH_THRESHOLD = float(os.getenv("PLAN_MATCH_THRESHOLD", "0.85"))
+
+class PlanningError(Exception):
+    """The planner could not produce (or repair) an executable statement. The message is user-facing."""
+
 class DataAccessAgent:
     def __init__(self, model_id: str, host: str | None = None):
-        self.gs = GraphStore().load()
-        self.agent = Agent(
-            model=Gemini(id=model_id),
-            system_message=SYSTEM_MESSAGE,
-            markdown=True,
-        )
-
-    def answer(self, user_question: str):
-        # 0) Load KG JSON (verbatim) for the prompt
-        kg_path = os.getenv("KG_JSON_PATH", "./graph/store_graph.json")
+        self.agent = LazyAgent(SYSTEM_MESSAGE, markdown=True, model_id=model_id, task="plan")
+        self.repairer = LazyAgent(SYSTEM_MESSAGE, markdown=True, task="repair")  # fast tier
+        self.flights = SingleFlight()
+        self.plans = PlanIndex(threshold=PLAN_MATCH_THRESHOLD)
+        self.log = QuestionLog()  # question fingerprint -> answering SQL + frequency (feeds the warmer)
+        self.answers = AnswerCache()
+
+    @property
+    def gs(self) -> GraphStore:
+        return get_graph_store()
+
+    def answer(self, user_question: str, cancel=None):
+        # Concurrent identical questions wait on one planner call + one query.
+        return self.flights.do(normalize_message(user_question), self._answer, user_question, cancel=cancel)
+
+    def query(self, user_question: str, cancel=None) -> QueryResult:
+        """Plan + execute and return the columnar result (for API clients, not humans)."""
+        return self.flights.do(("rows", normalize_message(user_question)), self._query, user_question, cancel=cancel)
+
+    def resolve_sql(self, user_question: str) -> str:
+        """
+        Plan (and repair) without fetching rows: the statement is validated with a
+        LIMIT 0 probe so exports can stream the real result straight from the DB.
+        """
+        probe = lambda s: run_sql("postgres", f"SELECT * FROM ({s}) AS _probe LIMIT 0", govern=False, replica=False)
+        stmt, _ = self._plan_and_execute(user_question, probe)
+        return stmt
+
+    def _answer(self, user_question: str, cancel=None):
+        try:
+            res = self._query(user_question, cancel=cancel)
+        except QueryCancelled:
+            return "Request cancelled."
+        except PlanningError as e:
+            return str(e)
+        if res.empty:
+            return "No rows."
+        # Markdown is only rendered here, for the human-facing reply.
+        out = res.to_markdown(limit=25)
+        if res.auto_limited:
+            out += f"\n\n(Result capped at {len(res.df)} rows by the query governor; narrow the question for the rest.)"
+        return out
+
+    def _query(self, user_question: str, cancel=None) -> QueryResult:
+        fp = normalize_message(user_question)
+        res = self.answers.get(fp)
+        if res is None:
+            version = self.answers.version
+            stmt, df = self._plan_and_execute(user_question, lambda s: self._execute(s, cancel))
+            res = QueryResult(df, sql=stmt)
+            # Replica rows may predate the change that bumped `version`: don't pin them in the cache.
+            if df.attrs.get("source") != "replica":
+                self.answers.put(fp, res, version)
+        self.log.record(fp, user_question, res.sql)
+        return res
+
+    @staticmethod
+    def _execute(stmt: str, cancel=None, replica: bool = True):
+        # Literals -> binds at the execution boundary only: the plan index and the
+        # user-facing SQL keep the literal text (slot substitution works on it).
+        p = parameterize(stmt)
+        return run_sql("postgres", p.sql, p.params, cancel=cancel, replica=replica)
+
+    def _reuse_plan(self, user_question: str, execute):
+        """(SQL, result) from a stored plan for a paraphrase of the question, else None (plan afresh)."""
+        match = self.plans.lookup(user_question)
+        if match is None:
+            return None
+        stmt = normalize_sql_with_graph(match.sql, self.gs)
         try:
-            with open(kg_path, "r", encoding="utf-8") as f:
-                kg_json_text = f.read()
-        except Exception:
-            kg_json_text = "{}"
+            if check_joins_with_graph(stmt, self.gs):
+                return None
+            return stmt, execute(stmt)
+        except (QueryCancelled, Overloaded):  # cancellation / back-pressure must reach the API
+            raise
+        except Exception as e:
+            print(f"[plan-index] reuse of {match.matched_question!r} failed, replanning: {e}")
+            return None
+
+    def _plan_and_execute(self, user_question: str, execute):
+        """Return (final SQL, execute(final SQL)); raises PlanningError when no usable statement emerges."""
+        reused = self._reuse_plan(user_question, execute)
+        if reused is not None:
+            return reused
+        stmt, df = self._plan_with_llm(user_question, execute)
+        self.plans.add(user_question, stmt)
+        return stmt, df
+
+    def _plan_with_llm(self, user_question: str, execute):
+        # 0) KG JSON for the prompt (Postgres subgraph, serialized once per load)
+        kg_json_text = self.gs.prompt_json(ENGINE)
+        join_hints = self.gs.join_hints_text(ENGINE)
 
         # 1) Ask the LLM for a single executable Postgres query (SQL-only contract)
         prompt = f"""
@@ -267,11 +439,15 @@ Use ONLY objects present in this KG. Do NOT invent columns or tables.
 ### Knowledge Graph (JSON)
 {kg_json_text}
 
+### Join clauses (precomputed from the KG)
+{join_hints}
+
 ### Hard rules
 - Engine: PostgreSQL only.
 - Use schema-qualified table names exactly as in the KG (e.g., sales.orders, ref.regional_managers).
 - If a column has uppercase or special characters (e.g., "Sales", "Profit", "Order ID", "State/Province"),
   you MUST double-quote it everywhere you reference it.
+- Join tables ONLY with the precomputed join clauses above (you may add aliases). Never invent join conditions.
 - If you use aggregates, include ALL non-aggregate selected columns in GROUP BY.
 - Produce exactly ONE statement that RETURNS ROWS (SELECT or WITH ... SELECT). No DDL/DML. No multi-statements.
 - Output ONLY the SQL inside one ```sql fenced block. No prose.
@@ -297,26 +473,35 @@ User question:
 
 (Use the same Knowledge Graph JSON as above.)
 """
-            raw2 = self.agent.run(repair_prompt).content or ""
+            raw2 = self.repairer.run(repair_prompt).content or ""
             sql_block = extract_sql_block(raw2)
             stmt = pick_resultset_statement(sql_block or raw2)
 
         if not stmt:
-            return "Planner did not produce a SELECT/WITH statement."
+            raise PlanningError("Planner did not produce a SELECT/WITH statement.")
 
         # 2) Light normalization (table FQNs + identifier quoting aids)
         stmt = normalize_sql_with_graph(stmt, self.gs)
 
-        # 3) Execute. If it fails or doesn't return rows, self-repair ONCE with exact error + KG.
+        # 3) Validate joins locally, then execute. If validation fails, the governor
+        #    rejects it (cost/rows/timeout) or it doesn't return rows, self-repair ONCE
+        #    with exact error + KG.
         try:
-            df = run_sql("postgres", stmt)
-        except (ProgrammingError, ResourceClosedError) as e:
+            issues = check_joins_with_graph(stmt, self.gs)
+            if issues:
+                raise QueryRejected("Rejected by KG join validator:\n" + "\n".join(issues))
+            df = execute(stmt)
+        except (QueryCancelled, Overloaded):  # cancellation / back-pressure must reach the API
+            raise
+        except (ProgrammingError, ResourceClosedError, QueryRejected) as e:
             # Try a HINT-based fix first (UndefinedColumn with hint)
             fixed = repair_from_hint(stmt, str(e))
             if fixed:
                 try:
-                    df = run_sql("postgres", fixed)
+                    df = execute(fixed)
                     stmt = fixed
+                except Overloaded:
+                    raise
                 except Exception as e2:
                     # Fall back to LLM self-repair
                     repair2 = f"""
@@ -334,12 +519,12 @@ User question:
 
 Return ONLY the SQL in one ```sql fenced block.
 """
-                    raw3 = self.agent.run(repair2).content or ""
+                    raw3 = self.repairer.run(repair2).content or ""
                     sql3 = extract_sql_block(raw3) or raw3
                     stmt2 = pick_resultset_statement(sql3)
                     if not stmt2:
-                        return f"SQL execution failed:\n{e2}\n\nSQL:\n{fixed}"
-                    df = run_sql("postgres", stmt2)
+                        raise PlanningError(f"SQL execution failed:\n{e2}\n\nSQL:\n{fixed}")
+                    df = self._execute_repaired(execute, stmt2)
                     stmt = stmt2
             else:
                 # Ask the model to self-repair with the exact error + KG
@@ -358,16 +543,24 @@ User question:
 
 Return ONLY the SQL in one ```sql fenced block.
 """
-                raw3 = self.agent.run(repair2).content or ""
+                raw3 = self.repairer.run(repair2).content or ""
                 sql3 = extract_sql_block(raw3) or raw3
                 stmt2 = pick_resultset_statement(sql3)
                 if not stmt2:
-                    return f"SQL execution failed:\n{e}\n\nSQL:\n{stmt}"
-                df = run_sql("postgres", stmt2)
+                    raise PlanningError(f"SQL execution failed:\n{e}\n\nSQL:\n{stmt}")
+                df = self._execute_repaired(execute, stmt2)
                 stmt = stmt2
         except Exception as e:
-            return f"SQL execution failed:\n{e}\n\nSQL:\n{stmt}"
+            raise PlanningError(f"SQL execution failed:\n{e}\n\nSQL:\n{stmt}")
 
-        if df is None or df.empty:
-            return "No rows."
-        return summarize(df, limit=25)
+        return stmt, df
+
+    @staticmethod
+    def _execute_repaired(execute, stmt: str):
+        # Last attempt: no further repair round, so any failure is a planning failure.
+        try:
+            return execute(stmt)
+        except (QueryCancelled, Overloaded):
+            raise
+        except Exception as e:
+            raise PlanningError(f"SQL execution failed after repair:\n{e}\n\nSQL:\n{stmt}") from e
@@ -0,0 +1,103 @@
+# agents/hr_templates.py
+"""
+Deterministic escalation drafts for the HR agent.
+
+Standard escalation types are recognised by keywords and rendered from Jinja
+templates; only requests that match no type, or that ask for custom content
+("include the top 3 orders", "summarize ..."), go to the LLM.
+"""
+import re
+from jinja2 import Template
+
+_SCOPE = "{% for k, v in scope.items() %}{{ v }} {{ k }}{% if not loop.last %}, {% endif %}{% endfor %}"
+
+_BODY = Template("""Hi {{ manager }},
+
+{{ opening }}{% if scope %} ({{ scope_text }}){% endif %}.
+
+Details from {{ sender }}:
+{{ request_text }}
+
+{{ ask }}
+
+Thanks,
+{{ sender }}
+""")
+
+# kind -> (keyword regex, subject, opening line, ask)
+ESCALATION_TYPES = {
+    "shipping_delay": (
+        r"\b(ship|shipping|shipped|deliver\w*|undelivered|late|delay\w*|transit)\b",
+        "Escalation: shipping delays",
+        "I'm escalating shipping/delivery delays that need your attention",
+        "Could you confirm an owner and an expected resolution date for the affected orders?",
+    ),
+    "returns": (
+        r"\b(returns?|returned|refunds?|rma)\b",
+        "Escalation: returns and refunds",
+        "I'm escalating a returns/refunds issue",
+        "Could you review the affected returns and confirm how they should be handled?",
+    ),
+    "complaint": (
+        r"\b(complain\w*|unhappy|angry|dissatisfied|upset)\b",
+        "Escalation: customer complaint",
+        "I'm escalating a customer complaint",
+        "Could you reach out to the customer or assign someone who can?",
+    ),
+    "pricing": (
+        r"\b(discounts?|pricing|prices?|margins?|unprofitable|losses)\b",
+        "Escalation: pricing and discount concerns",
+        "I'm escalating a pricing/discount concern",
+        "Could you review the discounting and let me know whether it should change?",
+    ),
+    "stock": (
+        r"\b(stock|stockouts?|inventory|backorder\w*)\b",
+        "Escalation: inventory / stock issue",
+        "I'm escalating an inventory issue",
+        "Could you confirm when stock will be replenished?",
+    ),
+}
+_TYPE_RX = {kind: re.compile(spec[0], re.IGNORECASE) for kind, spec in ESCALATION_TYPES.items()}
+# Requests asking for content a template can't produce go to the LLM.
+FREE_FORM_RX = re.compile(r"\b(include|attach|summari[sz]e|list|explain|top \d+|analy[sz]e|compare)\b", re.IGNORECASE)
+
+SUBJECT = Template("{{ subject }}{% if scope %} — " + _SCOPE + "{% endif %}")
+SCOPE_TEXT = Template(_SCOPE)
+
+DIGEST_SUBJECT = Template("Escalation digest: {{ total }} escalation{{ 's' if total != 1 }} "
+                          "({{ groups|length }} topic{{ 's' if groups|length != 1 }})")
+DIGEST_BODY = Template("""Hi {{ manager }},
+
+{{ total }} escalation{{ 's were' if total != 1 else ' was' }} raised to you between {{ start }} and {{ end }}. \
+Near-identical ones are grouped below.
+{% for g in groups %}
+{{ loop.index }}. {{ g.subject }} — {{ g.count }} request{{ 's' if g.count != 1 }} from {{ g.senders|join(', ') }}
+{%- for t in g.samples %}
+   - {{ t }}
+{%- endfor %}
+{% endfor %}
+Reply to the individual requesters as needed.
+
+— StoreBot
+""")
+
+
+def classify_escalation(request_text: str) -> str | None:
+    """The standard escalation type for `request_text`, or None when it needs a free-form (LLM) draft."""
+    if FREE_FORM_RX.search(request_text or ""):
+        return None
+    for kind, rx in _TYPE_RX.items():
+        if rx.search(request_text or ""):
+            return kind
+    return None
+
+
+def render_escalation(kind: str, manager: str, sender: str, request_text: str, scope: dict) -> dict:
+    _, subject, opening, ask = ESCALATION_TYPES[kind]
+    scope = {k: v for k, v in scope.items() if v}
+    return {
+        "to": manager,
+        "subject": SUBJECT.render(subject=subject, scope=scope),
+        "body": _BODY.render(manager=manager, sender=sender, request_text=request_text.strip(), opening=opening,
+                             ask=ask, scope=scope, scope_text=SCOPE_TEXT.render(scope=scope)),
+    }
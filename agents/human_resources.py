@@ -1,14 +1,16 @@
-from agno.agent import Agent
-#from agno.models.ollama import Ollama
-from agno.models.google import Gemini
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from tools.emailer import send_mail
-from dotenv import load_dotenv
 from agents.json_utils import loads_relaxed
-import os, json
+from agents.hr_templates import DIGEST_BODY, DIGEST_SUBJECT, classify_escalation, render_escalation
+from agents.models import LazyAgent
+from query.engines import get_engine
+from tools.scheduler import db_gate
+import os, json, threading, time
 
-load_dotenv()
-MY = create_engine(os.getenv("MYSQL_URL"), future=True)
+# Escalations to the same manager within this window go out as one digest email (0 = send each at once).
+# Opt-in: pending escalations live in memory only, so a crash inside the window loses them.
+HR_DIGEST_WINDOW_S = float(os.getenv("HR_DIGEST_WINDOW_S", "0"))
+HR_DIGEST_SAMPLES = 3  # distinct request texts quoted per digest group
 
 SYSTEM = """
 You are the Human Resources Agent for hierarchical escalations.
@@ -18,14 +20,92 @@ Given a request like 'escalate state X to LOB manager', you must:
 Return JSON: {"to":"...", "subject":"...", "body":"..."} only.
 """
 
+class EscalationDigests:
+    """
+    Per-manager pending escalations. The first one for a manager opens a
+    HR_DIGEST_WINDOW_S window; when it closes, everything pending goes out as a
+    single email (the plain draft if there is only one). Thread-safe.
+    """
+    def __init__(self, window_s: float = HR_DIGEST_WINDOW_S, send=send_mail):
+        self.window_s = window_s
+        self.send = send
+        self._lock = threading.Lock()
+        self._pending: dict[str, list[dict]] = {}
+        self._timers: dict[str, threading.Timer] = {}
+        self.queued = self.emails_sent = self.send_failures = 0
+
+    def add(self, draft: dict, kind: str | None, sender: str) -> int:
+        """Queue a draft for its recipient; returns how many are now pending for them."""
+        to = draft["to"]
+        with self._lock:
+            items = self._pending.setdefault(to, [])
+            items.append(dict(draft, kind=kind, sender=sender, at=time.time()))
+            self.queued += 1
+            if to not in self._timers:
+                t = self._timers[to] = threading.Timer(self.window_s, self.flush, args=(to,))
+                t.daemon = True
+                t.start()
+            return len(items)
+
+    def flush(self, to: str | None = None):
+        """Send the digest for `to` (or for everyone, e.g. at shutdown)."""
+        with self._lock:
+            targets = [to] if to is not None else list(self._pending)
+            batches = {}
+            for t in targets:
+                timer = self._timers.pop(t, None)
+                if timer is not None:
+                    timer.cancel()
+                batches[t] = self._pending.pop(t, [])
+        for t, items in batches.items():
+            if not items:
+                continue
+            subject, body = self._digest(t, items) if len(items) > 1 else (items[0]["subject"], items[0]["body"])
+            try:
+                self.send(t, subject, body)
+                with self._lock:
+                    self.emails_sent += 1
+            except Exception as e:
+                with self._lock:
+                    self.send_failures += 1
+                print(f"[hr-digest] sending {len(items)} escalation(s) to {t} failed: {type(e).__name__}: {e}")
+
+    @staticmethod
+    def _digest(to: str, items: list[dict]):
+        groups: dict[tuple, dict] = {}
+        for it in items:  # near-identical = same escalation type and subject (type + scope)
+            key = (it["kind"] or it["subject"], it["subject"])
+            g = groups.setdefault(key, {"subject": it["subject"], "count": 0, "senders": [], "samples": []})
+            g["count"] += 1
+            if it["sender"] not in g["senders"]:
+                g["senders"].append(it["sender"])
+            text_ = it.get("request_text", "").strip()
+            if text_ and text_ not in g["samples"] and len(g["samples"]) < HR_DIGEST_SAMPLES:
+                g["samples"].append(text_)
+        fmt = lambda ts: time.strftime("%H:%M", time.localtime(ts))
+        ctx = dict(manager=to, total=len(items), groups=list(groups.values()),
+                   start=fmt(items[0]["at"]), end=fmt(items[-1]["at"]))
+        return DIGEST_SUBJECT.render(**ctx), DIGEST_BODY.render(**ctx)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = sum(len(v) for v in self._pending.values())
+            queued, sent, failed = self.queued, self.emails_sent, self.send_failures
+        return {"window_s": self.window_s, "queued": queued, "pending": pending,
+                "emails_sent": sent, "send_failures": failed,
+                "emails_saved": max(0, queued - pending - sent - failed)}
+
+
 class HumanResourcesAgent:
     def __init__(self, model_id: str, host: str):
-        #self.agent = Agent(model=Ollama(id=model_id, host=host), system_message=SYSTEM, markdown=False)
-        self.agent = Agent(model=Gemini(id=model_id), system_message=SYSTEM, markdown=False)
+        self.agent = LazyAgent(SYSTEM, model_id=model_id, task="hr")
+        self.digests = EscalationDigests()
+        self._lock = threading.Lock()
+        self._drafts = {"template": [0, 0.0], "llm": [0, 0.0]}  # path -> [drafts, seconds]
 
     def _lookup_manager(self, region=None, state=None, segment=None, category=None):
         # naive examples; expand as needed
-        with MY.connect() as c:
+        with db_gate.slot(), get_engine("mysql").connect() as c:
             if region:
                 row = c.execute(text('SELECT `Manager` FROM customer_succces_managers WHERE `Regions`=:r LIMIT 1'), {"r":region}).fetchone()
                 if row: return row[0]
@@ -34,12 +114,38 @@ class HumanResourcesAgent:
                 if row: return row[0]
         return None
 
+    def draft(self, request_text: str, sender_email: str, mgr: str, scope: dict):
+        """(draft, kind): a Jinja draft for standard escalation types, else one LLM call."""
+        t0 = time.perf_counter()
+        kind = classify_escalation(request_text)
+        if kind is not None:
+            data, path = render_escalation(kind, mgr, sender_email, request_text, scope), "template"
+        else:
+            plan = self.agent.run(f"Asker: {sender_email}\nTarget: {mgr}\nRequest: {request_text}\nJSON only.").content
+            data, path = loads_relaxed(plan), "llm"
+        with self._lock:
+            self._drafts[path][0] += 1
+            self._drafts[path][1] += time.perf_counter() - t0
+        return dict(data, request_text=request_text), kind
+
     def draft_and_send(self, request_text: str, sender_email: str, region=None, state=None, segment=None, category=None, send=False, to_override=None):
         mgr = to_override or self._lookup_manager(region=region, state=state, segment=segment, category=category) or "manager@example.com"
-        plan = self.agent.run(f"Asker: {sender_email}\nTarget: {mgr}\nRequest: {request_text}\nJSON only.").content
-        data = loads_relaxed(plan)
+        scope = {"region": region, "state": state, "segment": segment, "category": category}
+        data, kind = self.draft(request_text, sender_email, mgr, scope)
         if send:
-            send_mail(data["to"], data["subject"], data["body"])
-            return f"Email sent to {data['to']}."
+            if self.digests.window_s <= 0:
+                send_mail(data["to"], data["subject"], data["body"])
+                return f"Email sent to {data['to']}."
+            n = self.digests.add(data, kind, sender_email)
+            return (f"Escalation queued for {data['to']} ({n} pending); it goes out in one digest "
+                    f"within {self.digests.window_s:.0f}s.")
         return f"Draft ready for {data['to']}:\nSubject: {data['subject']}\n\n{data['body']}"
 
+    def stats(self) -> dict:
+        """Drafting throughput per path (template vs LLM) plus digest/mail volume."""
+        with self._lock:
+            drafts = {path: {"drafts": n, "mean_ms": round(secs / n * 1000, 2) if n else None,
+                             "drafts_per_s": round(n / secs, 1) if secs else None}
+                      for path, (n, secs) in self._drafts.items()}
+        return {"drafting": drafts, "digests": self.digests.stats()}
+
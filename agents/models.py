@@ -0,0 +1,315 @@
+# agents/models.py
+"""
+Model tiers, health tracking and failover for every agent's LLM calls.
+
+Each task has an ordered chain of model specs (first healthy one wins):
+
+    route / repair   small, fast model    (GEMINI_FAST_MODEL)
+    plan / write / hr the main model      (GEMINI_MODEL)
+
+overridable per task with MODEL_<TASK>="gemini-2.5-flash,ollama:llama3.2".
+MODEL_FALLBACK is appended to every chain (e.g. a local "ollama:tinyllama").
+A spec is "<id>" / "gemini:<id>", "ollama:<id>", or
+"stub:<latency_ms>[:<error_rate>]" (canned replies, for load/failover drills).
+
+Every spec has a rolling window of latencies and errors and a circuit breaker:
+it opens when the window's error rate or median latency crosses its limit,
+skips the model for MODEL_CB_COOLDOWN_S, then lets one trial call through.
+A call with no reply after MODEL_CALL_TIMEOUT_S counts as an error and fails over.
+
+    python -m agents.models drill      # stub chain with injected latency/errors
+"""
+import contextvars, os, random, threading, time
+from collections import deque
+from dotenv import load_dotenv
+from tools.scheduler import llm_gate
+
+load_dotenv()
+
+DEFAULT_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-2.5-flash-lite")
+TASK_DEFAULTS = {"route": FAST_MODEL, "repair": FAST_MODEL,
+                 "plan": DEFAULT_MODEL, "write": DEFAULT_MODEL, "hr": DEFAULT_MODEL}
+MODEL_FALLBACK = os.getenv("MODEL_FALLBACK", "")
+
+CB_WINDOW = int(os.getenv("MODEL_CB_WINDOW", "20"))
+CB_MIN_CALLS = int(os.getenv("MODEL_CB_MIN_CALLS", "5"))
+CB_ERROR_RATE = float(os.getenv("MODEL_CB_ERROR_RATE", "0.5"))
+CB_SLOW_S = float(os.getenv("MODEL_CB_SLOW_S", "20"))
+CB_COOLDOWN_S = float(os.getenv("MODEL_CB_COOLDOWN_S", "30"))
+CALL_TIMEOUT_S = float(os.getenv("MODEL_CALL_TIMEOUT_S", "60"))  # 0 = wait forever
+
+
+class ModelUnavailable(RuntimeError):
+    """Every model in the task's chain is failing or has an open breaker."""
+
+
+class ModelTimeout(TimeoutError):
+    """A provider call gave no reply within MODEL_CALL_TIMEOUT_S."""
+
+
+def model_chain(task: str | None, model_id: str | None = None) -> list[str]:
+    """Ordered specs for `task`: MODEL_<TASK> env, else model_id, else the tier default; plus MODEL_FALLBACK."""
+    env = os.getenv(f"MODEL_{task.upper()}", "") if task else ""
+    chain = [s.strip() for s in env.split(",") if s.strip()] or [model_id or TASK_DEFAULTS.get(task, DEFAULT_MODEL)]
+    chain += [s.strip() for s in MODEL_FALLBACK.split(",") if s.strip() and s.strip() not in chain]
+    return chain
+
+
+class ModelHealth:
+    """Rolling latency/error window plus a closed -> open -> half-open circuit breaker."""
+    def __init__(self, spec: str, slow_s: float = CB_SLOW_S):
+        self.spec = spec
+        self.slow_s = slow_s
+        self._lock = threading.Lock()
+        self._window = deque(maxlen=CB_WINDOW)  # (latency_s, ok)
+        self.state = "closed"
+        self.opened_at = 0.0
+        self._trial = False
+        self.calls = self.errors = self.trips = 0
+
+    def may_allow(self) -> bool:
+        """Lock-free pre-check: could allow() say yes right now? (Doesn't claim the half-open trial.)"""
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= CB_COOLDOWN_S
+        return not self._trial
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= CB_COOLDOWN_S:
+                self.state = "half-open"
+            if self.state == "half-open" and not self._trial:
+                self._trial = True  # exactly one probe call until it reports back
+                return True
+            return False
+
+    def abandon_trial(self):
+        """A claimed half-open trial ended without a verdict (e.g. the call was never made)."""
+        with self._lock:
+            self._trial = False
+
+    def record(self, latency_s: float, ok: bool):
+        with self._lock:
+            self.calls += 1
+            self.errors += int(not ok)
+            self._window.append((latency_s, ok))
+            if self.state == "half-open":
+                self._trial = False
+                if ok and latency_s <= self.slow_s:
+                    self.state = "closed"
+                    self._window.clear()
+                else:
+                    self._open()
+                return
+            if self.state == "closed" and len(self._window) >= CB_MIN_CALLS:
+                err, p50 = self._error_rate(), self._p50()
+                if err >= CB_ERROR_RATE or p50 > self.slow_s:
+                    self._open()
+
+    def _open(self):
+        self.state, self.opened_at = "open", time.monotonic()
+        self.trips += 1
+
+    def _error_rate(self) -> float:
+        return sum(not ok for _, ok in self._window) / len(self._window) if self._window else 0.0
+
+    def _p50(self) -> float:
+        lat = sorted(l for l, _ in self._window)
+        return lat[len(lat) // 2] if lat else 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lat = sorted(l for l, _ in self._window)
+            return {"state": self.state, "calls": self.calls, "errors": self.errors, "trips": self.trips,
+                    "window_error_rate": round(self._error_rate(), 3),
+                    "p50_s": round(self._p50(), 3),
+                    "p95_s": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))], 3) if lat else None}
+
+
+_health: dict[str, ModelHealth] = {}
+_health_lock = threading.Lock()
+
+def get_health(spec: str) -> ModelHealth:
+    h = _health.get(spec)
+    if h is None:
+        with _health_lock:
+            h = _health.setdefault(spec, ModelHealth(spec))
+    return h
+
+def health() -> dict:
+    """Process-wide health per model spec (shared by every agent using that model)."""
+    return {spec: h.stats() for spec, h in list(_health.items())}
+
+
+class _StubReply:
+    def __init__(self, content):
+        self.content = content
+
+class StubAgent:
+    """Stands in for an agno Agent: sleeps `latency_ms`, fails with `error_rate`, returns `reply`."""
+    def __init__(self, latency_ms: float = 0.0, error_rate: float = 0.0, reply: str = ""):
+        self.latency_ms, self.error_rate, self.reply = latency_ms, error_rate, reply
+
+    def run(self, prompt: str):
+        time.sleep(self.latency_ms / 1000)
+        if random.random() < self.error_rate:
+            raise RuntimeError("stub model error")
+        return _StubReply(self.reply or os.getenv("STUB_MODEL_REPLY", "ok"))
+
+
+def _error_output(out) -> str | None:
+    """Why a run output is a failure, or None. agno doesn't raise on provider errors: it returns
+    a RunOutput with status ERROR and the error text as content."""
+    status = getattr(out, "status", None)
+    if getattr(status, "value", status) == "ERROR":
+        return f"run status ERROR: {getattr(out, 'content', '')}"
+    if not getattr(out, "content", None):
+        return "empty model output"
+    return None
+
+
+def _run_with_deadline(agent, prompt: str, timeout_s: float):
+    """
+    agent.run(prompt), or ModelTimeout after `timeout_s`. The call runs in a daemon
+    thread (with the caller's context) that is left behind if it hangs: the caller's
+    llm_gate slot is released and the hung call is recorded as a failure.
+    """
+    if timeout_s <= 0:
+        return agent.run(prompt)
+    box, done = {}, threading.Event()
+    ctx = contextvars.copy_context()
+
+    def call():
+        try:
+            box["out"] = ctx.run(agent.run, prompt)
+        except BaseException as e:
+            box["error"] = e
+        finally:
+            done.set()
+
+    threading.Thread(target=call, name="llm-call", daemon=True).start()
+    if not done.wait(timeout_s):
+        raise ModelTimeout(f"no reply within {timeout_s:g}s")
+    if "error" in box:
+        raise box["error"]
+    return box["out"]
+
+
+def build_agent(spec: str, system_message: str, markdown: bool = False):
+    kind, _, ident = spec.partition(":") if ":" in spec else ("gemini", "", spec)
+    if kind == "stub":
+        latency, _, err = ident.partition(":")
+        return StubAgent(float(latency or 0), float(err or 0))
+    from agno.agent import Agent
+    if kind == "ollama":
+        from agno.models.ollama import Ollama  # optional; needs the `ollama` package
+        model = Ollama(id=ident, host=os.getenv("OLLAMA_HOST", "http://localhost:11434"))
+    elif kind == "gemini":
+        from agno.models.google import Gemini
+        model = Gemini(id=ident)
+    else:
+        raise ValueError(f"unknown model spec {spec!r} (use gemini:, ollama: or stub:)")
+    return Agent(model=model, system_message=system_message, markdown=markdown)
+
+
+class LazyAgent:
+    """
+    An agno Agent per model in the task's chain, each built — and agno and the
+    provider SDK only imported — on first use. Lets the router and agents be
+    constructed for free at startup. run() takes the first model whose
+    breaker allows it and fails over down the chain on errors.
+    """
+    def __init__(self, system_message: str, markdown: bool = False, model_id: str | None = None,
+                 task: str | None = None):
+        self.system_message = system_message
+        self.markdown = markdown
+        self.task = task
+        self.chain = model_chain(task, model_id)
+        self.model_id = self.chain[0]
+        self.last_model = None
+        self._agents = {}
+        self._lock = threading.Lock()
+
+    def _agent_for(self, spec: str):
+        a = self._agents.get(spec)
+        if a is None:
+            with self._lock:
+                a = self._agents.get(spec)
+                if a is None:
+                    a = self._agents[spec] = build_agent(spec, self.system_message, self.markdown)
+        return a
+
+    @property
+    def agent(self):
+        """The primary model's agent (used by warm-up)."""
+        return self._agent_for(self.chain[0])
+
+    def run(self, prompt: str):
+        last = None
+        for spec in self.chain:
+            h = get_health(spec)
+            if not h.may_allow():
+                continue
+            try:
+                agent = self._agent_for(spec)  # build outside the gate; only the provider call holds a slot
+            except Exception as e:  # e.g. optional provider package missing
+                if h.allow():
+                    h.record(0.0, False)
+                last = e
+                continue
+            with llm_gate.slot():
+                # Claim the breaker (and a half-open trial) only once a slot is held, so an
+                # Overloaded gate can't leave a trial claimed with no call to settle it.
+                if not h.allow():
+                    continue
+                t0 = time.perf_counter()
+                recorded = False
+                try:
+                    out = _run_with_deadline(agent, prompt, CALL_TIMEOUT_S)
+                    error = _error_output(out)
+                    h.record(time.perf_counter() - t0, error is None)
+                    recorded = True
+                    if error is None:
+                        self.last_model = spec
+                        return out
+                    last = RuntimeError(error)
+                except Exception as e:
+                    if not recorded:
+                        h.record(time.perf_counter() - t0, False)
+                        recorded = True
+                    last = e
+                finally:
+                    if not recorded:  # BaseException (e.g. KeyboardInterrupt): free the trial
+                        h.abandon_trial()
+                print(f"[models] {self.task or 'default'}: {spec} failed ({type(last).__name__}: {last}); failing over")
+        raise ModelUnavailable(f"no model available for task {self.task or 'default'!r} "
+                               f"(chain {self.chain}); last error: {last}")
+
+
+def drill(calls: int = 60) -> dict:
+    """Failover drill on stubs: a slow (80 ms), flaky (30% errors) primary in front of a fast fallback."""
+    primary, fallback = "stub:80:0.3", "stub:5"
+    with _health_lock:
+        _health[primary] = ModelHealth(primary, slow_s=0.05)
+        _health[fallback] = ModelHealth(fallback, slow_s=0.05)
+    la = LazyAgent("drill")
+    la.chain = [primary, fallback]
+    served = {}
+    t0 = time.perf_counter()
+    for _ in range(calls):
+        la.run("ping")
+        served[la.last_model] = served.get(la.last_model, 0) + 1
+    return {"calls": calls, "elapsed_s": round(time.perf_counter() - t0, 2), "served_by": served,
+            "health": health()}
+
+
+if __name__ == "__main__":
+    import argparse, json
+    ap = argparse.ArgumentParser()
+    ap.add_argument("cmd", choices=["drill"])
+    ap.add_argument("--calls", type=int, default=60)
+    print(json.dumps(drill(ap.parse_args().calls), indent=2))
@@ -0,0 +1,419 @@
+# agents/plan_index.py
+"""
+Paraphrase-tolerant plan reuse for the Data Access Agent.
+
+Questions are reduced to a template by extracting entity slots (regions,
+states, segments, categories, years, counts): "profit in West for 2021" ->
+"profit in <region> for <year>". Templates are indexed as TF-IDF vectors over
+word-bounded char 3-grams plus words, and a lookup runs a vectorized cosine
+top-k over an inverted index (NumPy only), re-scoring the top candidates
+exactly. A hit above the threshold reuses the stored SQL with the new slot
+values substituted for the old literals.
+
+    python -m agents.plan_index bench [--n 100000]
+"""
+from __future__ import annotations
+
+import math
+import re
+import threading
+from difflib import SequenceMatcher
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+REGIONS = ["Central", "East", "South", "West"]
+SEGMENTS = ["Consumer", "Corporate", "Home Office"]
+CATEGORIES = ["Furniture", "Office Supplies", "Technology"]
+STATES = [
+    "Alabama", "Alaska", "Arizona", "Arkansas", "California", "Colorado", "Connecticut", "Delaware",
+    "District of Columbia", "Florida", "Georgia", "Hawaii", "Idaho", "Illinois", "Indiana", "Iowa",
+    "Kansas", "Kentucky", "Louisiana", "Maine", "Maryland", "Massachusetts", "Michigan", "Minnesota",
+    "Mississippi", "Missouri", "Montana", "Nebraska", "Nevada", "New Hampshire", "New Jersey",
+    "New Mexico", "New York", "North Carolina", "North Dakota", "Ohio", "Oklahoma", "Oregon",
+    "Pennsylvania", "Rhode Island", "South Carolina", "South Dakota", "Tennessee", "Texas", "Utah",
+    "Vermont", "Virginia", "Washington", "West Virginia", "Wisconsin", "Wyoming",
+]
+SLOT_VOCAB: Dict[str, List[str]] = {
+    "state": STATES, "region": REGIONS, "segment": SEGMENTS, "category": CATEGORIES,
+}
+# Kinds whose values appear in SQL as quoted string literals (vs. bare numbers).
+STRING_SLOTS = set(SLOT_VOCAB)
+
+STOPWORDS = {"a", "an", "the", "of", "by", "per", "wise", "for", "is", "are", "what", "whats", "s",
+             "me", "show", "give", "tell", "please", "list", "each", "across", "and", "to", "my", "our"}
+
+Slot = Tuple[str, str]  # (kind, canonical value)
+
+
+def _build_slot_rx():
+    phrases = {v.lower(): (kind, v) for kind, values in SLOT_VOCAB.items() for v in values}
+    # Longest first so "West Virginia" wins over "West", "Home Office" over "Office".
+    alts = sorted(phrases, key=len, reverse=True)
+    rx = re.compile(r"\b(" + "|".join(re.escape(a) for a in alts) + r")\b|\b((?:19|20)\d{2})\b|\b(\d{1,4})\b",
+                    re.IGNORECASE)
+    return rx, phrases
+
+_SLOT_RX, _PHRASES = _build_slot_rx()
+
+
+def extract_slots(question: str) -> Tuple[str, List[Slot]]:
+    """Return (template, slots) with every entity mention replaced by <kind>."""
+    slots: List[Slot] = []
+
+    def repl(m):
+        if m.group(1):
+            kind, value = _PHRASES[m.group(1).lower()]
+        elif m.group(2):
+            kind, value = "year", m.group(2)
+        else:
+            kind, value = "n", m.group(3)
+        slots.append((kind, value))
+        return f" <{kind}> "
+
+    template = _SLOT_RX.sub(repl, question or "")
+    words = [w for w in re.findall(r"<\w+>|[a-z0-9]+", template.lower()) if w not in STOPWORDS]
+    return " ".join(words), slots
+
+
+def _stem(w: str) -> str:
+    return w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w
+
+
+def _word_set(template: str) -> frozenset:
+    return frozenset(_stem(w) for w in template.split())
+
+
+NEGATION_PREFIXES = ("un", "non", "in", "im", "il", "ir", "dis")
+
+
+def _same_word(a: str, b: str) -> bool:
+    # typo tolerance only for longer words: "prfit" ~ "profit", never "top" ~ "bottom"
+    if a == b:
+        return True
+    if min(len(a), len(b)) < 4 or abs(len(a) - len(b)) > 2:
+        return False
+    long, short = (a, b) if len(a) > len(b) else (b, a)
+    if any(long == p + short for p in NEGATION_PREFIXES):  # "unprofitable" is the opposite, not a typo
+        return False
+    m = SequenceMatcher(None, a, b)
+    return m.quick_ratio() >= 0.8 and m.ratio() >= 0.8
+
+
+def words_compatible(q: frozenset, d: frozenset, known=frozenset()) -> bool:
+    """
+    Every content word must have a counterpart on the other side. Cosine alone
+    lets a changed measure ("quantity" vs "sales"), direction ("bottom" vs "top")
+    or a negation ("not") through whenever the rest of the question overlaps.
+    Query words in `known` (words of stored questions) are real words, not typos:
+    they only match exactly.
+    """
+    fuzzy = [w for w in q - d if w not in known]
+    return len(fuzzy) == len(q - d) and all(any(_same_word(w, x) for x in d) for w in fuzzy) and \
+        all(any(_same_word(w, x) for x in fuzzy) for w in d - q)
+
+
+def _features(template: str) -> Dict[str, int]:
+    """Term counts: (lightly stemmed) words plus word-bounded char 3-grams, which tolerate typos and morphology."""
+    feats: Dict[str, int] = {}
+    for w in template.split():
+        key = "w:" + _stem(w)
+        feats[key] = feats.get(key, 0) + 1
+        if w.startswith("<"):
+            continue
+        padded = f" {w} "
+        for i in range(len(padded) - 2):
+            g = padded[i:i + 3]
+            feats[g] = feats.get(g, 0) + 1
+    return feats
+
+
+_IDENT_SPLIT = re.compile(r'("(?:""|[^"])*")')
+_YEAR_TOKEN = re.compile(r"(?<![\w.])((?:19|20)\d{2})(?![\w.])")
+
+
+def _shift_years(parts: List[str], pairs: List[Tuple[str, str]]) -> List[str] | None:
+    """
+    Year slots also drive derived bounds ('2021-01-01' .. '2022-01-01'). With one
+    year slot, every year within +-1 of it is shifted by the same delta; with
+    several, each is mapped directly. Any other year in the SQL makes the reuse
+    unsafe (None).
+    """
+    code = [p for i, p in enumerate(parts) if i % 2 == 0]
+    found = {int(y) for p in code for y in _YEAR_TOKEN.findall(p)}
+    olds = [int(was) for was, _ in pairs]
+    if not set(olds) <= found:
+        return None
+    if len(pairs) == 1:
+        was, now = olds[0], int(pairs[0][1])
+        mapping = {y: y + now - was for y in (was - 1, was, was + 1)}
+    else:
+        mapping = {int(was): int(now) for was, now in pairs}
+    if found - set(mapping):
+        return None
+    sub = lambda m: str(mapping[int(m.group(1))])
+    return [_YEAR_TOKEN.sub(sub, p) if i % 2 == 0 else p for i, p in enumerate(parts)]
+
+
+def substitute_slots(sql: str, old: List[Slot], new: List[Slot]) -> str | None:
+    """
+    Swap the stored question's literals for the new question's, outside quoted
+    identifiers. Returns None when the slots don't line up or an old literal
+    can't be found exactly where expected.
+    """
+    if [k for k, _ in old] != [k for k, _ in new]:
+        return None
+    parts = _IDENT_SPLIT.split(sql)
+    years = [(was, now) for (kind, was), (_, now) in zip(old, new) if kind == "year"]
+    if any(was != now for was, now in years):
+        parts = _shift_years(parts, years)
+        if parts is None:
+            return None
+    for (kind, was), (_, now) in zip(old, new):
+        if was == now or kind == "year":
+            continue
+        if kind in STRING_SLOTS:
+            rx = re.compile(r"'" + re.escape(was.replace("'", "''")) + r"'", re.IGNORECASE)
+            sub = "'" + now.replace("'", "''") + "'"
+        else:
+            rx, sub = re.compile(rf"(?<![\w.'-]){was}(?![\w.'-])"), now
+        hits = sum(len(rx.findall(p)) for i, p in enumerate(parts) if i % 2 == 0)
+        if hits == 0 or (kind == "n" and hits != 1):
+            return None
+        parts = [rx.sub(sub, p) if i % 2 == 0 else p for i, p in enumerate(parts)]
+    return "".join(parts)
+
+
+@dataclass
+class PlanMatch:
+    sql: str
+    score: float
+    matched_question: str
+
+
+class PlanIndex:
+    """
+    Similarity index over answered questions -> SQL. Thread-safe.
+
+    Docs are frozen into an inverted index (CSC-style arrays) every
+    `rebuild_every` additions; newer docs are scored exactly until then.
+    Candidates come from the word postings only, rarest first, up to about
+    `max_postings` entries; the top_k are then re-scored exactly on the full
+    word + char-gram vectors, and a match must also use the same content
+    words (up to typos). Rebuilds run outside the lock and are swapped in, so
+    lookups never wait on one.
+    """
+    def __init__(self, threshold: float = 0.85, top_k: int = 16, max_postings: int = 20_000,
+                 rebuild_every: int = 128):
+        self.threshold = threshold
+        self.top_k = top_k
+        self.max_postings = max_postings
+        self.rebuild_every = rebuild_every
+        self._lock = threading.RLock()
+        self._rebuild_lock = threading.Lock()  # one rebuild at a time, outside _lock
+        self._vocab: Dict[str, int] = {}
+        self._by_template: Dict[str, int] = {}
+        self.questions: List[str] = []
+        self.slots: List[List[Slot]] = []
+        self.sqls: List[str] = []
+        self._tf: List[Dict[int, int]] = []
+        self._words: List[frozenset] = []
+        self._known_words: set = set()  # every word of every stored template
+        # frozen state
+        self._n_frozen = 0
+        self._idf = np.zeros(0, dtype=np.float32)
+        self._ptr = np.zeros(1, dtype=np.int64)
+        self._post_doc = np.zeros(0, dtype=np.int32)
+        self._post_w = np.zeros(0, dtype=np.float32)
+        self._is_word = np.zeros(0, dtype=bool)
+        self._doc_vecs: List[Dict[int, float]] = []
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.sqls)
+
+    # ---------- writes ----------
+
+    def add(self, question: str, sql: str):
+        template, slots = extract_slots(question)
+        if not template:
+            return
+        with self._lock:
+            doc = self._by_template.get(template)
+            if doc is not None:  # same template: latest working SQL wins
+                self.questions[doc], self.slots[doc], self.sqls[doc] = question, slots, sql
+                return
+
+            tf = {}
+            for f, c in _features(template).items():
+                tf[self._vocab.setdefault(f, len(self._vocab))] = c
+            self._by_template[template] = len(self.sqls)
+            self.questions.append(question)
+            self.slots.append(slots)
+            self.sqls.append(sql)
+            self._tf.append(tf)
+            self._words.append(_word_set(template))
+            self._known_words |= self._words[-1]
+            due = len(self.sqls) - self._n_frozen >= self.rebuild_every
+        if due:
+            self._rebuild(wait=False)
+
+    def _rebuild(self, wait: bool = True):
+        """Freeze all docs added so far. The O(N) build runs without holding `_lock`."""
+        if not self._rebuild_lock.acquire(blocking=wait):
+            return  # another thread is already rebuilding; it (or the next add) catches up
+        try:
+            with self._lock:  # snapshot: tf dicts are never mutated after add()
+                tfs = self._tf[:]
+                vocab = list(self._vocab.items())
+            frozen = self._build(tfs, vocab)
+            with self._lock:
+                (self._ptr, self._post_doc, self._post_w, self._is_word, self._idf,
+                 self._doc_vecs, self._n_frozen) = frozen
+        finally:
+            self._rebuild_lock.release()
+
+    @staticmethod
+    def _build(tfs: List[Dict[int, int]], vocab: List[Tuple[str, int]]):
+        n, v = len(tfs), len(vocab)
+        lens = np.fromiter((len(tf) for tf in tfs), dtype=np.int64, count=n)
+        feat = np.fromiter((f for tf in tfs for f in tf), dtype=np.int64, count=int(lens.sum()))
+        cnt = np.fromiter((c for tf in tfs for c in tf.values()), dtype=np.float32, count=len(feat))
+        doc = np.repeat(np.arange(n, dtype=np.int32), lens)
+
+        df = np.bincount(feat, minlength=v)
+        idf = (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+        w = cnt * idf[feat]
+        norms = np.sqrt(np.bincount(doc, weights=w * w, minlength=n)).astype(np.float32)
+        w /= norms[doc]
+
+        # inverted index over word features only
+        is_word = np.zeros(v, dtype=bool)
+        is_word[[fid for f, fid in vocab if f.startswith("w:")]] = True
+        keep = is_word[feat]
+        order = np.argsort(feat[keep], kind="stable")
+        ptr = np.concatenate([[0], np.cumsum(np.where(is_word, df, 0))]).astype(np.int64)
+        starts = np.concatenate([[0], np.cumsum(lens)])
+        doc_vecs = [dict(zip(feat[starts[i]:starts[i + 1]].tolist(), w[starts[i]:starts[i + 1]].tolist()))
+                    for i in range(n)]
+        return ptr, doc[keep][order], w[keep][order], is_word, idf, doc_vecs, n
+
+    # ---------- reads ----------
+
+    def _query_vec(self, template: str) -> Dict[int, float]:
+        q, unseen = {}, 0
+        for f, c in _features(template).items():
+            fid = self._vocab.get(f)
+            if fid is None:
+                # No stored doc has this feature, but it still counts in the query norm
+                # (weighted as the rarest feature), so new words lower every score.
+                unseen -= 1
+                fid = unseen
+            q[fid] = c * self._idf_of(fid)
+        norm = math.sqrt(sum(x * x for x in q.values())) or 1.0
+        return {f: x / norm for f, x in q.items()}
+
+    def _idf_of(self, fid: int) -> float:
+        # features unseen or first seen since the last rebuild get the max idf (they're rare so far)
+        if 0 <= fid < len(self._idf):
+            return float(self._idf[fid])
+        return float(self._idf.max()) if len(self._idf) else 1.0
+
+    def _pending_vec(self, doc: int) -> Dict[int, float]:
+        # docs added since the last rebuild, weighted with the frozen idf
+        vec = {f: c * self._idf_of(f) for f, c in self._tf[doc].items()}
+        norm = math.sqrt(sum(x * x for x in vec.values())) or 1.0
+        return {f: x / norm for f, x in vec.items()}
+
+    def _candidates(self, q: Dict[int, float]) -> List[int]:
+        if not self._n_frozen or not q:
+            return []
+        # rarest words first; stop once enough postings are gathered (common words
+        # like "sales" barely move the ranking and would dominate the scatter-add)
+        fids, total = [], 0
+        for f in sorted((f for f in q if 0 <= f < len(self._is_word) and self._is_word[f]), key=lambda f: self._ptr[f + 1] - self._ptr[f]):
+            if fids and total >= self.max_postings:
+                break
+            fids.append(f)
+            total += int(self._ptr[f + 1] - self._ptr[f])
+        if not fids:
+            return []
+        docs = np.concatenate([self._post_doc[self._ptr[f]:self._ptr[f + 1]] for f in fids])
+        ws = np.concatenate([self._post_w[self._ptr[f]:self._ptr[f + 1]] * q[f] for f in fids])
+        if not len(docs):
+            return []
+        scores = np.bincount(docs, weights=ws, minlength=self._n_frozen)
+        k = min(self.top_k, self._n_frozen)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [int(d) for d in top if scores[d] > 0]
+
+    def lookup(self, question: str) -> PlanMatch | None:
+        """Best stored plan for a paraphrase of `question`, with its literals swapped in; else None."""
+        template, slots = extract_slots(question)
+        with self._lock:
+            doc, score = self._by_template.get(template), 1.0
+            if doc is None and self.sqls:
+                q = self._query_vec(template)
+                words = _word_set(template)
+                cands = self._candidates(q) + list(range(self._n_frozen, len(self.sqls)))
+                best = (0.0, None)
+                for d in cands:
+                    vec = self._doc_vecs[d] if d < self._n_frozen else self._pending_vec(d)
+                    s = sum(w * vec.get(f, 0.0) for f, w in q.items())
+                    # word check last: it only runs for candidates that would win
+                    if s > best[0] and s >= self.threshold and words_compatible(words, self._words[d], self._known_words):
+                        best = (s, d)
+                score, doc = best
+            if doc is None or score < self.threshold:
+                self.misses += 1
+                return None
+            sql = substitute_slots(self.sqls[doc], self.slots[doc], slots)
+            if sql is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return PlanMatch(sql=sql, score=round(score, 4), matched_question=self.questions[doc])
+
+    def stats(self) -> dict:
+        return {"size": len(self.sqls), "hits": self.hits, "misses": self.misses, "threshold": self.threshold}
+
+
+def bench(n: int = 100_000, queries: int = 2_000, seed: int = 0) -> dict:
+    """Synthetic n-question index; returns add/rebuild time and lookup latency percentiles (ms)."""
+    import random
+    import time
+    rnd = random.Random(seed)
+    measures = ["sales", "profit", "quantity", "discount", "orders", "returns", "customers", "products"]
+    dims = ["region", "state", "segment", "category", "city", "month", "quarter", "ship mode", "customer", "product"]
+    shapes = ["{m} by {d}", "what's {m} per {d}?", "{d}-wise {m}", "top {k} {d} by {m}", "total {m} in {e}",
+              "{m} trend by {d} for {y}", "average {m} per {d} in {e}", "how many {m} per {d} in {y}"]
+    def make():
+        return rnd.choice(shapes).format(m=rnd.choice(measures), d=rnd.choice(dims), k=rnd.randint(3, 20),
+                                         e=rnd.choice(REGIONS + STATES), y=rnd.randint(2014, 2024)) \
+            + f" variant {rnd.randint(0, 10**6)}"
+    idx = PlanIndex(rebuild_every=n + 1)
+    t0 = time.perf_counter()
+    for i in range(n):
+        idx.add(make(), f"SELECT {i}")
+    idx._rebuild()
+    build_s = time.perf_counter() - t0
+    lat = []
+    for _ in range(queries):
+        q = make()
+        t = time.perf_counter()
+        idx.lookup(q)
+        lat.append((time.perf_counter() - t) * 1000)
+    lat.sort()
+    return {"size": len(idx), "build_s": round(build_s, 2),
+            "p50_ms": round(lat[len(lat) // 2], 3), "p99_ms": round(lat[int(len(lat) * 0.99)], 3)}
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("cmd", choices=["bench"])
+    ap.add_argument("--n", type=int, default=100_000)
+    args = ap.parse_args()
+    print(bench(args.n))
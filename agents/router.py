@@ -1,10 +1,11 @@
-from agno.agent import Agent
-#from agno.models.ollama import Ollama
-from agno.models.google import Gemini
-from agents.data_access import DataAccessAgent
-from agents.customer_success import CustomerSuccessAgent
-from agents.human_resources import HumanResourcesAgent
-import os
+from agents.json_utils import loads_relaxed
+from agents.models import LazyAgent
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from query.engines import DB_POOL_SIZE, get_engine
+from tools.scheduler import admit, stats as scheduler_stats
+from tools.singleflight import SingleFlight, normalize_message
+import os, time
 
 INTENT_SYSTEM = """
 You are the Router. Classify the user's request into one of:
@@ -14,26 +15,118 @@ You are the Router. Classify the user's request into one of:
 Return JSON: {"intent":"data_access|customer_success|hr"} ONLY.
 """
 
+BATCH_INTENT_SYSTEM = """
+You are the Router. You receive a numbered list of user requests.
+Classify EACH request into one of:
+- "data_access" (questions / analytics),
+- "customer_success" (create/modify orders, returns),
+- "hr" (org hierarchy / escalations / email drafting/ escalate to managers).
+Return JSON: {"intents":["data_access|customer_success|hr", ...]} ONLY,
+with exactly one intent per request, in the same order.
+"""
+
+INTENTS = ("data_access", "customer_success", "hr")
+
+# Batch knobs: workers default to the DB pool size so fan-out never queues on the pool.
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", str(DB_POOL_SIZE)))
+METRICS_TOP_STATEMENTS = int(os.getenv("METRICS_TOP_STATEMENTS", "20"))
+BATCH_ROUTE_CHUNK = int(os.getenv("BATCH_ROUTE_CHUNK", "50"))
+
 class Router:
+    """
+    Cheap to construct: the specialist agents (and the heavy imports behind
+    them) are built on first use. Call warm_up() to pay that cost up front.
+    """
     def __init__(self):
         #model_id = os.getenv("OLLAMA_MODEL", "tinyllama")
-        model_id = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
-        host = os.getenv("OLLAMA_HOST", "http://localhost:11434")
-        #self.router = Agent(model=Ollama(id=model_id, host=host), system_message=INTENT_SYSTEM, markdown=False)
-        self.router = Agent(model=Gemini(id=model_id), system_message=INTENT_SYSTEM, markdown=False)
-        self.da = DataAccessAgent(model_id, host)
-        self.cs = CustomerSuccessAgent(model_id, host)
-        self.hr = HumanResourcesAgent(model_id, host)
-
-    def handle(self, msg: str, **kwargs):
-        import json
-        print(self.router.run(msg).content)
-        intent = json.loads(self.router.run(msg).content)["intent"]
+        self.model_id = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+        self.host = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+        # Routing runs on the fast tier (MODEL_ROUTE / GEMINI_FAST_MODEL), not self.model_id.
+        self.router = LazyAgent(INTENT_SYSTEM, task="route")
+        self.batch_router = LazyAgent(BATCH_INTENT_SYSTEM, task="route")
+        self.pool = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch")
+        self.flights = SingleFlight()
+
+    @cached_property
+    def da(self):
+        from agents.cache_warmer import CacheWarmer
+        from agents.data_access import DataAccessAgent
+        da = DataAccessAgent(self.model_id, self.host)
+        # The warmer only has work once data access exists, so it starts with it (if WARMER_ENABLED).
+        self._warmer = CacheWarmer(da)
+        self._warmer.start()
+        return da
+
+    @property
+    def warmer(self):
+        self.da
+        return self._warmer
+
+    @cached_property
+    def cs(self):
+        from agents.customer_success import CustomerSuccessAgent
+        return CustomerSuccessAgent(self.model_id, self.host)
+
+    @cached_property
+    def hr(self):
+        from agents.human_resources import HumanResourcesAgent
+        return HumanResourcesAgent(self.model_id, self.host)
+
+    def warm_up(self) -> dict:
+        """
+        Optional warm-up hook: import the heavy modules, build every agno agent,
+        load the KG and open one connection per engine. Returns seconds per step.
+        """
+        from sqlalchemy import text
+        timings = {}
+        def step(name, fn):
+            t0 = time.perf_counter()
+            try:
+                fn()
+                timings[name] = round(time.perf_counter() - t0, 3)
+            except Exception as e:  # warm-up is best effort; the first request retries
+                timings[name] = f"error: {type(e).__name__}: {e}"
+        step("agents", lambda: [a.agent for a in (self.router, self.batch_router,
+                                                  self.da.agent, self.da.repairer, self.cs.agent,
+                                                  self.hr.agent)])
+        step("graph", lambda: self.da.gs)
+        for name in ("postgres", "mysql"):
+            def ping(name=name):
+                with get_engine(name).connect() as c:
+                    c.execute(text("SELECT 1"))
+            step(name, ping)
+        return timings
+
+    def classify(self, msg: str) -> str:
+        return loads_relaxed(self.router.run(msg).content)["intent"]
+
+    def classify_many(self, msgs: list[str]) -> list[str | None]:
+        """
+        Classify many messages with one model call per chunk. Entries the model
+        fails to classify come back as None so callers can fall back per message.
+        """
+        out: list[str | None] = []
+        for i in range(0, len(msgs), BATCH_ROUTE_CHUNK):
+            chunk = msgs[i:i + BATCH_ROUTE_CHUNK]
+            numbered = "\n".join(f"{n}. {m}" for n, m in enumerate(chunk, 1))
+            try:
+                intents = loads_relaxed(self.batch_router.run(numbered).content)["intents"]
+            except Exception:
+                intents = []
+            if len(intents) != len(chunk):
+                intents = [None] * len(chunk)
+            out.extend(it if it in INTENTS else None for it in intents)
+        return out
+
+    def dispatch(self, intent: str, msg: str, cancel=None, **kwargs):
         print('intent:', intent)
         if intent == "data_access":
-            return self.da.answer(msg)
+            return self.da.answer(msg, cancel=cancel)
         if intent == "customer_success":
-            return self.cs.act(msg, confirmed=kwargs.get("confirmed", False))
+            out = self.cs.act(msg, confirmed=kwargs.get("confirmed", False))
+            if out.startswith("SUCCESS") and "da" in self.__dict__:
+                self.warmer.notify_change()  # cached answers are stale; re-warm the popular ones
+            return out
         if intent == "hr":
             return self.hr.draft_and_send(msg, sender_email=kwargs.get("sender_email","user@example.com"),
                                           region=kwargs.get("region"), state=kwargs.get("state"),
@@ -41,3 +134,81 @@ class Router:
                                           send=kwargs.get("send_email", False), to_override=kwargs.get("to"))
         return "Sorry, I couldn't route that."
 
+    def handle(self, msg: str, cancel=None, priority: str = "interactive", **kwargs):
+        # Every LLM call / DB execution below queues under `priority`, fairly per sender.
+        with admit(priority, kwargs.get("sender_email")):
+            # Only the routing decision is shared between identical in-flight messages: Customer
+            # Success writes and HR sends must run once per request. Data access coalesces itself.
+            intent = self.flights.do(normalize_message(msg), self._route, msg)
+            return self.dispatch(intent, msg, cancel=cancel, **kwargs)
+
+    def _route(self, msg: str) -> str:
+        # A fresh cached answer can only exist for a question data access already answered: skip routing.
+        if "da" in self.__dict__ and self.da.answers.fresh(normalize_message(msg)):
+            return "data_access"
+        return self.classify(msg)
+
+    def metrics(self) -> dict:
+        from agents.models import health
+        from query.parameterize import get_statement_stats
+        from query.replica import get_replica
+        out = {"router_singleflight": self.flights.stats(), "scheduler": scheduler_stats(),
+               "models": health()}
+        stats = get_statement_stats()
+        out["statements"] = dict(stats.summary(), top=stats.top(METRICS_TOP_STATEMENTS))
+        rep = get_replica()
+        out["replica"] = rep.status() if rep is not None else {"enabled": False}
+        if "da" in self.__dict__:  # don't build the agent just to report on it
+            out["data_access_singleflight"] = self.da.flights.stats()
+            out["plan_index"] = self.da.plans.stats()
+            out["cache_warmer"] = self.warmer.stats()
+        if "hr" in self.__dict__:
+            out["hr"] = self.hr.stats()
+        return out
+
+    def handle_batch(self, items: list[dict]) -> dict:
+        """
+        Answer many independent requests. Each item is {"message": ..., **handle kwargs}.
+        Identical data questions are answered once (Customer Success and HR items always
+        run per item), routing is batched into as few model calls as possible, and dispatch fans out over a bounded worker pool. Results keep the
+        input order; a failing item reports {"error": ...} without failing the batch.
+        """
+        with admit("batch"):
+            return self._handle_batch(items)
+
+    def _handle_batch(self, items: list[dict]) -> dict:
+        t0 = time.perf_counter()
+        keys = [(it["message"].strip(), tuple(sorted((k, v) for k, v in it.items() if k != "message")))
+                for it in items]
+        unique = list(dict.fromkeys(keys))
+        intents = dict(zip(unique, self.classify_many([msg for msg, _ in unique])))
+
+        def run_one(key, intent):
+            msg, kw = key
+            try:
+                with admit("batch", dict(kw).get("sender_email")):  # pool threads don't inherit context
+                    return {"reply": self.dispatch(intent or self.classify(msg), msg, **dict(kw))}
+            except Exception as e:
+                return {"error": f"{type(e).__name__}: {e}"}
+
+        # Identical data questions share one answer; writes and sends run once per item.
+        shared, futures = {}, []
+        for k in keys:
+            if intents[k] == "data_access":
+                if k not in shared:
+                    shared[k] = self.pool.submit(run_one, k, "data_access")
+                futures.append(shared[k])
+            else:
+                futures.append(self.pool.submit(run_one, k, intents[k]))
+        results = [f.result() for f in futures]
+        elapsed = time.perf_counter() - t0
+        return {
+            "results": results,
+            "stats": {
+                "items": len(items),
+                "unique": len(unique),
+                "executed": len(set(futures)),
+                "elapsed_s": round(elapsed, 3),
+                "items_per_s": round(len(items) / elapsed, 2) if elapsed else None,
+            },
+        }
@@ -1,11 +1,52 @@
 import os
-from fastapi import FastAPI, Body, Query
+import asyncio
+import itertools
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Body, Query, Request, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from agents.router import Router
+from tools.scheduler import Overloaded, call_as
 
-app = FastAPI(title="StoreBot (Agno + Ollama)")
+# Agents, engines, the KG and the heavy imports behind them (agno, pandas,
+# networkx, SQLAlchemy) are created on first use, not at import time.
+WARMUP = os.getenv("STOREBOT_WARMUP", "false").lower() == "true"
 
-router = Router()
+_router = None
+_router_lock = threading.Lock()
+
+def get_router():
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                from agents.router import Router
+                _router = Router()
+    return _router
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from query.replica import start_refresher
+    start_refresher()
+    if WARMUP:
+        print("warm-up:", await run_in_threadpool(get_router().warm_up))
+    yield
+    if "hr" in get_router().__dict__:
+        get_router().hr.digests.flush()  # don't drop escalations still waiting for their digest window
+
+app = FastAPI(title="StoreBot (Agno + Ollama)", lifespan=lifespan)
+
+if os.getenv("STOREBOT_PRELOAD_KG", "false").lower() == "true":
+    # With a pre-fork server (gunicorn --preload) workers share the loaded KG copy-on-write.
+    from graph.graph_store import preload_shared_graph
+    preload_shared_graph()
+
+@app.exception_handler(Overloaded)
+async def overloaded(request: Request, exc: Overloaded):
+    # Queues for the LLM or the DB are past this class's deadline: fail fast, let the client back off.
+    return JSONResponse(status_code=429, content={"detail": str(exc)},
+                        headers={"Retry-After": str(max(1, round(exc.retry_after)))})
 
 class ChatIn(BaseModel):
     message: str
@@ -18,9 +59,21 @@ class ChatIn(BaseModel):
     send_email: bool | None = False
     to: str | None = None
 
+async def run_cancellable(request: Request, fn, *args, **kwargs):
+    """Run a blocking handler in the threadpool; set its `cancel` event if the client disconnects."""
+    cancel = threading.Event()
+    task = asyncio.ensure_future(run_in_threadpool(fn, *args, cancel=cancel, **kwargs))
+    while not task.done():
+        if await request.is_disconnected():
+            cancel.set()
+            break
+        await asyncio.wait({task}, timeout=0.25)
+    return await task
+
 @app.post("/chat")
-def chat(inp: ChatIn):
-    out = router.handle(
+async def chat(inp: ChatIn, request: Request):
+    out = await run_cancellable(
+        request, get_router().handle,
         inp.message,
         confirmed=inp.confirmed,
         sender_email=inp.sender_email,
@@ -29,6 +82,62 @@ def chat(inp: ChatIn):
     )
     return {"reply": out}
 
+class ChatBatchIn(BaseModel):
+    items: list[ChatIn]
+
+@app.post("/chat/batch")
+def chat_batch(inp: ChatBatchIn):
+    return get_router().handle_batch([it.model_dump() for it in inp.items])
+
+class DataIn(BaseModel):
+    message: str
+    limit: int | None = 1000
+
+@app.post("/data")
+async def data(inp: DataIn, request: Request):
+    """Answer a data question as compact JSON columns (no Markdown rendering)."""
+    from agents.data_access import PlanningError
+    try:
+        res = await run_cancellable(request, call_as, "interactive", None, get_router().da.query, inp.message)
+    except PlanningError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return res.to_json_columns(limit=inp.limit)
+
+class ExportIn(BaseModel):
+    message: str
+    format: str = "arrow"
+
+@app.post("/export")
+def export(inp: ExportIn):
+    """Stream the full result of a data question as Arrow IPC or Parquet."""
+    from agents.data_access import PlanningError
+    from query.columnar import EXPORT_FORMATS as MEDIA_TYPES, encode_batches
+    from query.federation import stream_sql
+    from query.governor import QueryRejected
+    if inp.format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"format must be one of {sorted(MEDIA_TYPES)}")
+    try:
+        sql = call_as("batch", None, get_router().da.resolve_sql, inp.message)
+    except PlanningError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    ext = "arrows" if inp.format == "arrow" else "parquet"
+    # Prime the stream: the plan check and the first fetch run before the 200 headers go out,
+    # so a governor rejection becomes a 422 instead of a truncated, empty download.
+    batches = stream_sql("postgres", sql)
+    try:
+        first = next(batches)
+    except QueryRejected as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return StreamingResponse(
+        encode_batches(itertools.chain([first], batches), inp.format),
+        media_type=MEDIA_TYPES[inp.format],
+        headers={"Content-Disposition": f'attachment; filename="export.{ext}"'},
+    )
+
+@app.get("/metrics")
+def metrics():
+    return get_router().metrics()
+
 @app.get("/")
 def health():
     return {"ok": True}
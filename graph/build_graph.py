@@ -1,72 +1,149 @@
-from graph_store import GraphStore
-
-# Build nodes for tables + columns and encode where each table lives
-# We deliberately do not encode PK/FK constraints—only "joinable by" hints.
-
-TABLES = {
-  # table_name : {location, schema (pg/mysql), columns [...]}
-  "sales.orders": {
-    "location": {"engine": "postgres", "schema": "sales", "table": "orders"},
-    "columns": ["Row ID","Order ID","Order Date","Ship Date","Ship Mode","Customer ID","Customer Name",
-                "Segment","Country/Region","City","State/Province","Postal Code","Region",
-                "Product ID","Category","Sub-Category","Product Name", "Sales", "Quantity", "Discount", "Profit"]
-  },
-  "ref.returns": {
-    "location": {"engine": "postgres", "schema": "ref", "table": "returns"},
-    "columns": ["Returned","ID"]
-  },
-  "regional_managers": {
-    "location": {"engine": "postgres", "schema": "ref", "table": "regional_managers"},
-    "columns": ["Regional Manager","Regions"]
-  },
-  "state_managers": {
-    "location": {"engine": "postgres", "schema": "ref", "table": "state_managers"},
-    "columns": ["State/Province","Manager"]
-  },
-  "segment_managers": {
-    "location": {"engine": "postgres", "schema": "ref", "table": "segment_managers"},
-    "columns": ["Segment","Manager"]
-  },
-  "category_managers": {
-    "location": {"engine": "postgres", "schema": "ref", "table": "category_managers"},
-    "columns": ["Category","Manager"]
-  },
-  "customer_succces_managers": {
-    "location": {"engine": "postgres", "schema": "ref", "table": "customer_succces_managers"},
-    "columns": ["Regions","Manager"]
-  },
-}
-
-# join hints (undirected semantics modeled as two directed edges)
-JOINS = [
+"""
+Build / refresh the knowledge graph from the live databases.
+
+Tables and columns are introspected from information_schema on both engines;
+only the "joinable by" hints below are curated by hand. We deliberately do
+not encode PK/FK constraints.
+
+    python -m graph.build_graph          # incremental: re-scan only tables whose DDL changed
+    python -m graph.build_graph --full   # rebuild every table
+
+Writes the reviewable JSON and the binary snapshot (see GraphStore.save).
+"""
+import argparse
+import hashlib
+import os
+import sys
+from pathlib import Path
+
+if __package__ in (None, ""):  # allow `python graph/build_graph.py`
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import text
+
+from graph.graph_store import GraphStore
+from query.engines import get_engine
+
+PG_SCHEMAS = [s.strip() for s in os.getenv("KG_PG_SCHEMAS", "sales,ref").split(",") if s.strip()]
+
+# Curated join hints between table FQNs (undirected; stored as two directed edges).
+JOIN_HINTS = [
   # Orders joinable with Returns via Order ID ~ ID
-  ("sales.orders", "ref.returns", {"on": [["Order ID","ID"]]}),
-  ("ref.returns", "sales.orders", {"on": [["ID","Order ID"]]}),
-
-  # Orders enrich with region/state/segment/category managers
-  ("sales.orders", "regional_managers", {"on": [["Region","Regions"]]}),
-  ("sales.orders", "state_managers", {"on": [["State/Province","State/Province"]]}),
-  ("sales.orders", "segment_managers", {"on": [["Segment","Segment"]]}),
-  ("sales.orders", "category_managers", {"on": [["Category","Category"]]}),
+  ("sales.orders", "ref.returns", [["Order ID", "ID"]]),
+
+  # Orders enrich with region/state/segment/category/customer-success managers
+  ("sales.orders", "ref.regional_managers", [["Region", "Regions"]]),
+  ("sales.orders", "ref.state_managers", [["State/Province", "State/Province"]]),
+  ("sales.orders", "ref.segment_managers", [["Segment", "Segment"]]),
+  ("sales.orders", "ref.category_managers", [["Category", "Category"]]),
+  ("sales.orders", "ref.customer_succces_managers", [["Region", "Regions"]]),
 ]
 
-def main():
-    gs = GraphStore().load()
+# Per-table DDL fingerprint computed server-side, so unchanged tables cost one row each.
+PG_HASHES = """
+SELECT table_schema, table_name,
+       md5(string_agg(column_name || ':' || data_type, ',' ORDER BY ordinal_position)) AS ddl_hash
+FROM information_schema.columns
+WHERE table_schema = ANY(:schemas)
+GROUP BY table_schema, table_name
+ORDER BY table_schema, table_name
+"""
+PG_COLUMNS = """
+SELECT column_name, data_type
+FROM information_schema.columns
+WHERE table_schema = :schema AND table_name = :table
+ORDER BY ordinal_position
+"""
+MY_HASHES = """
+SELECT table_schema, table_name,
+       MD5(GROUP_CONCAT(CONCAT(column_name, ':', data_type) ORDER BY ordinal_position SEPARATOR ',')) AS ddl_hash
+FROM information_schema.columns
+WHERE table_schema = DATABASE()
+GROUP BY table_schema, table_name
+ORDER BY table_schema, table_name
+"""
+MY_COLUMNS = """
+SELECT column_name, data_type
+FROM information_schema.columns
+WHERE table_schema = :schema AND table_name = :table
+ORDER BY ordinal_position
+"""
+
+def ddl_hash(columns) -> str:
+    """Client-side twin of the server-side fingerprint above."""
+    return hashlib.md5(",".join(f"{c}:{t}" for c, t in columns).encode()).hexdigest()
+
+def _scan(engine: str, conn, hashes_sql: str, columns_sql: str, params: dict, known: dict, full: bool):
+    """Yield (fqn, meta) for every live table; columns are only fetched for new/changed tables."""
+    for schema, table, h in conn.execute(text(hashes_sql), params).fetchall():
+        fqn = f"{schema}.{table}"
+        meta = {"location": {"engine": engine, "schema": schema, "table": table}, "ddl_hash": h}
+        if full or known.get(fqn) != h:
+            rows = conn.execute(text(columns_sql), {"schema": schema, "table": table}).fetchall()
+            meta["columns"] = [(c, t) for c, t in rows]
+        yield fqn, meta
+
+def introspect(known: dict, full: bool = False) -> dict:
+    """{fqn: {"location", "ddl_hash", ["columns"]}} across Postgres and MySQL."""
+    live = {}
+    with get_engine("postgres").connect() as c:
+        live.update(_scan("postgres", c, PG_HASHES, PG_COLUMNS, {"schemas": PG_SCHEMAS}, known, full))
+    if os.getenv("MYSQL_URL"):
+        with get_engine("mysql").connect() as c:
+            c.execute(text("SET SESSION group_concat_max_len = 1000000"))
+            live.update(_scan("mysql", c, MY_HASHES, MY_COLUMNS, {}, known, full))
+    return live
+
+def _drop_table(G, fqn: str):
+    cols = [n for n in G.successors(fqn) if G.nodes[n].get("type") == "column"]
+    G.remove_nodes_from(cols + [fqn])
+
+def _add_table(G, fqn: str, meta: dict):
+    G.add_node(fqn, type="table", location=meta["location"], ddl_hash=meta["ddl_hash"])
+    for col, dtype in meta["columns"]:
+        G.add_node(f"{fqn}.{col}", type="column", table=fqn, data_type=dtype)
+        G.add_edge(fqn, f"{fqn}.{col}", type="has_column")
+
+def apply_join_hints(gs: GraphStore):
+    """Replace every join edge with the curated JOIN_HINTS (so edited or removed hints take effect)."""
+    gs.G.remove_edges_from([(u, v) for u, v, d in gs.G.edges(data=True) if d.get("type") == "join"])
+    for a, b, on in JOIN_HINTS:
+        if a not in gs.G or b not in gs.G:
+            continue
+        cols_a, cols_b = set(gs.column_names(a)), set(gs.column_names(b))
+        bad = [p for p in on if p[0] not in cols_a or p[1] not in cols_b]
+        if bad:
+            print(f"WARNING: join hint {a} -> {b} skipped; unknown columns {bad}")
+            continue
+        gs.G.add_edge(a, b, type="join", on=[list(p) for p in on])
+        gs.G.add_edge(b, a, type="join", on=[[y, x] for x, y in on])
+
+def refresh(gs: GraphStore, full: bool = False) -> dict:
+    """Bring the graph in line with the live schemas. Returns what changed."""
     G = gs.G
-    G.clear()
+    known = {t: G.nodes[t].get("ddl_hash") for t in gs.tables()}
+    live = introspect(known, full=full)
 
-    for tname, meta in TABLES.items():
-        G.add_node(tname, type="table", location=meta["location"])
-        for col in meta["columns"]:
-            G.add_node(f"{tname}.{col}", type="column", table=tname)
-            G.add_edge(tname, f"{tname}.{col}", type="has_column")
+    removed = [t for t in known if t not in live]
+    changed = [t for t, meta in live.items() if "columns" in meta]
+    for t in removed + [t for t in changed if t in G]:
+        _drop_table(G, t)
+    for t in changed:
+        _add_table(G, t, live[t])
+    apply_join_hints(gs)  # cheap, and JOIN_HINTS may have changed without any DDL change
+    return {"changed": changed, "removed": removed, "unchanged": len(live) - len(changed)}
 
-    for a,b,attrs in JOINS:
-        G.add_edge(a, b, type="join", **attrs)
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--full", action="store_true", help="re-scan every table, not only changed DDL")
+    args = ap.parse_args()
 
+    gs = GraphStore().load()
+    diff = refresh(gs, full=args.full)
     gs.save()
+    G = gs.G
+    print(f"Changed {len(diff['changed'])}, removed {len(diff['removed'])}, unchanged {diff['unchanged']} tables.")
     print(f"Wrote graph with {G.number_of_nodes()} nodes and {G.number_of_edges()} edges.")
 
 if __name__ == "__main__":
     main()
-
@@ -1,40 +1,210 @@
 from __future__ import annotations
 import json
+import os
+import pickle
+import threading
 import networkx as nx
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterable, List, Tuple
 
-GRAPH_PATH = Path(__file__).parent / "store_graph.json"
+GRAPH_PATH = Path(os.getenv("KG_JSON_PATH", Path(__file__).parent / "store_graph.json"))
+SNAPSHOT_VERSION = 1
+
+# One hop of a join path: (left table, right table, [[left col, right col], ...])
+Hop = Tuple[str, str, List[List[str]]]
+
+def _quote(col: str) -> str:
+    return '"' + col + '"'
 
 class GraphStore:
+    """
+    The KG lives in two files: the reviewable node-link JSON (source of truth,
+    checked in) and a binary snapshot next to it (`.pkl`) that loads in a few
+    milliseconds. load() uses the snapshot unless the JSON is newer, in which
+    case it parses the JSON once and rewrites the snapshot.
+    """
     def __init__(self, path=GRAPH_PATH):
         self.path = Path(path)
+        self.snapshot_path = self.path.with_suffix(".pkl")
         self.G = nx.DiGraph()
+        self._prompt_json: Dict[str | None, str] = {}
+        self._join_adj: Dict[str, Dict[str, List[List[str]]]] = {}
+        self._join_paths: Dict[Tuple[str, str], List[Hop]] = {}
+        self._join_hints: Dict[str | None, str] = {}
 
     def load(self):
+        if self._snapshot_fresh():
+            try:
+                data = pickle.loads(self.snapshot_path.read_bytes())
+                if data.get("version") == SNAPSHOT_VERSION:
+                    self.G = data["graph"]
+                    return self._loaded()
+            except Exception:
+                pass  # corrupt / incompatible snapshot: fall back to the JSON
         if self.path.exists():
             data = json.loads(self.path.read_text())
-            self.G = nx.node_link_graph(data, directed=True)
-        return self
+            self.G = nx.node_link_graph(data, directed=True, edges="links")
+            self._write_snapshot()
+        return self._loaded()
 
     def save(self):
-        data = nx.node_link_data(self.G)
+        data = nx.node_link_data(self.G, edges="links")
         self.path.write_text(json.dumps(data, indent=2))
+        self._write_snapshot()
+        self._loaded()
 
-    def tables(self) -> List[str]:
-        return [n for n, d in self.G.nodes(data=True) if d.get("type") == "table"]
+    def _snapshot_fresh(self) -> bool:
+        if not self.snapshot_path.exists():
+            return False
+        return not self.path.exists() or self.snapshot_path.stat().st_mtime_ns >= self.path.stat().st_mtime_ns
+
+    def _write_snapshot(self):
+        tmp = self.snapshot_path.with_suffix(".pkl.tmp")
+        try:
+            tmp.write_bytes(pickle.dumps({"version": SNAPSHOT_VERSION, "graph": self.G},
+                                         protocol=pickle.HIGHEST_PROTOCOL))
+            os.replace(tmp, self.snapshot_path)
+        except OSError:
+            pass  # read-only deployments just keep parsing the JSON
+
+    def _loaded(self):
+        self._prompt_json = {}
+        self._join_hints = {}
+        self._build_join_index()
+        return self
+
+    def _build_join_index(self):
+        """
+        All-pairs shortest join paths over `join` edges only (never through
+        column nodes), treating each hint as undirected. BFS per table; the KG
+        is small, so this is a one-off cost at load time.
+        """
+        adj: Dict[str, Dict[str, List[List[str]]]] = {}
+        for a, b, d in self.G.edges(data=True):
+            if d.get("type") != "join":
+                continue
+            on = [list(p) for p in d.get("on", [])]
+            adj.setdefault(a, {})[b] = on
+            adj.setdefault(b, {}).setdefault(a, [[y, x] for x, y in on])
+        paths: Dict[Tuple[str, str], List[Hop]] = {}
+        for src in adj:
+            paths[(src, src)] = []
+            frontier = [src]
+            while frontier:
+                nxt = []
+                for u in frontier:
+                    for v, on in adj[u].items():
+                        if (src, v) not in paths:
+                            paths[(src, v)] = paths[(src, u)] + [(u, v, on)]
+                            nxt.append(v)
+                frontier = nxt
+        self._join_adj, self._join_paths = adj, paths
+
+    def tables(self, engine: str | None = None) -> List[str]:
+        return [n for n, d in self.G.nodes(data=True) if d.get("type") == "table"
+                and (engine is None or d.get("location", {}).get("engine") == engine)]
 
     def columns(self, table: str) -> List[str]:
         return [n for n, d in self.G.nodes(data=True)
                 if d.get("type") == "column" and d.get("table")==table]
 
+    def column_names(self, table: str) -> List[str]:
+        return [c[len(table) + 1:] for c in self.columns(table)]
+
     def resolve_table_location(self, table: str) -> Dict[str, Any]:
         return self.G.nodes[table]["location"]
 
+    def prompt_json(self, engine: str | None = None) -> str:
+        """Compact node-link JSON of the (engine's) subgraph for LLM prompts; built once per load."""
+        if engine not in self._prompt_json:
+            tables = self.tables(engine)
+            nodes = set(tables)
+            for t in tables:
+                nodes.update(self.columns(t))
+            data = nx.node_link_data(self.G.subgraph(nodes), edges="links")
+            self._prompt_json[engine] = json.dumps(data, separators=(",", ":"))
+        return self._prompt_json[engine]
+
     def join_path(self, table_a: str, table_b: str):
-        # returns simple path across join edges if exists
-        try:
-            return nx.shortest_path(self.G, table_a, table_b, weight=None)
-        except nx.NetworkXNoPath:
+        # returns the table path across join edges if one exists
+        hops = self.join_hops(table_a, table_b)
+        if hops is None:
+            return None
+        return [table_a] + [right for _, right, _ in hops]
+
+    def join_hops(self, table_a: str, table_b: str) -> List[Hop] | None:
+        """Precomputed shortest join path as hops with their ON column pairs ([] for a == b)."""
+        if table_a == table_b:
+            return []
+        return self._join_paths.get((table_a, table_b))
+
+    def join_on(self, table_a: str, table_b: str) -> List[List[str]] | None:
+        """ON column pairs of a direct join hint between two tables, if any."""
+        return self._join_adj.get(table_a, {}).get(table_b)
+
+    def join_clause(self, tables: Iterable[str], how: str = "JOIN",
+                    aliases: Dict[str, str] | None = None) -> str | None:
+        """
+        Ready-made FROM/JOIN clause connecting all `tables` (adding any
+        intermediate tables the paths need). Columns are qualified by alias when
+        given, else by the table FQN. Returns None if some table is unreachable.
+        """
+        tables = list(dict.fromkeys(tables))
+        if not tables:
             return None
+        aliases = aliases or {}
+        ref = lambda t: aliases.get(t, t)
+        decl = lambda t: f"{t} {aliases[t]}" if t in aliases else t
+
+        included = [tables[0]]
+        lines = [f"FROM {decl(tables[0])}"]
+        for t in tables[1:]:
+            if t in included:
+                continue
+            candidates = [self.join_hops(s, t) for s in included]
+            best = min((c for c in candidates if c is not None), key=len, default=None)
+            if best is None:
+                return None
+            for left, right, on in best:
+                if right in included:
+                    continue
+                cond = " AND ".join(f"{ref(left)}.{_quote(a)} = {ref(right)}.{_quote(b)}" for a, b in on)
+                lines.append(f"{how} {decl(right)} ON {cond}")
+                included.append(right)
+        return "\n".join(lines)
+
+    def join_hints_text(self, engine: str | None = None) -> str:
+        """One ready-made join clause per reachable table pair, for LLM prompts; built once per load."""
+        if engine not in self._join_hints:
+            tables = sorted(self.tables(engine))
+            lines = []
+            for i, a in enumerate(tables):
+                for b in tables[i + 1:]:
+                    clause = self.join_clause([a, b])
+                    if clause:
+                        lines.append(f"- {a} + {b}: " + clause.replace("\n", " "))
+            self._join_hints[engine] = "\n".join(lines)
+        return self._join_hints[engine]
+
+
+_shared: GraphStore | None = None
+_shared_lock = threading.Lock()
+
+def get_graph_store() -> GraphStore:
+    """Process-wide GraphStore, loaded on first use and shared by all agents."""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = GraphStore().load()
+    return _shared
 
+def preload_shared_graph() -> GraphStore:
+    """
+    Load the shared GraphStore in a pre-fork master (e.g. gunicorn --preload)
+    and freeze it out of the GC so forked workers share its pages copy-on-write.
+    """
+    import gc
+    gs = get_graph_store()
+    gc.freeze()
+    return gs
@@ -0,0 +1,172 @@
+# query/columnar.py
+"""
+Columnar result handling: compact JSON columns for the API, Arrow IPC /
+Parquet for bulk download, and Markdown only when a human reply is needed.
+pyarrow is optional and imported on first use.
+"""
+from __future__ import annotations
+
+import datetime as dt
+import io
+import math
+from decimal import Decimal
+from typing import Iterable, Iterator, List
+
+import pandas as pd
+
+EXPORT_FORMATS = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise RuntimeError("Arrow/Parquet export needs pyarrow: pip install pyarrow") from e
+    return pa
+
+
+def _json_value(v):
+    if v is None or v is pd.NaT or v is pd.NA:  # NaT is a datetime too: check it first
+        return None
+    if isinstance(v, float):
+        return None if math.isnan(v) else v
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, (dt.date, dt.datetime, pd.Timestamp)):
+        return v.isoformat()
+    if hasattr(v, "item"):  # numpy scalars
+        return v.item()
+    return v
+
+
+def unique_columns(names: Iterable) -> List[str]:
+    """Column names made unique (`a, a` -> `a, a_2`), e.g. for joins selecting the same column twice."""
+    taken = {str(n) for n in names}
+    seen: set = set()
+    out = []
+    for n in map(str, names):
+        name, i = n, 1
+        while name in seen or (i > 1 and name in taken):  # don't steal a later column's real name
+            i += 1
+            name = f"{n}_{i}"
+        seen.add(name)
+        out.append(name)
+    return out
+
+
+class QueryResult:
+    """One statement's result. Renderers are lazy; nothing is formatted until asked for."""
+
+    def __init__(self, df: pd.DataFrame | None, sql: str | None = None):
+        self.df = df if df is not None else pd.DataFrame()
+        self.sql = sql
+
+    @property
+    def empty(self) -> bool:
+        return self.df.empty
+
+    @property
+    def auto_limited(self) -> bool:
+        """The governor wrapped the statement in a LIMIT and it was reached: the DB has more rows."""
+        limit = self.df.attrs.get("row_limit")
+        return limit is not None and len(self.df) >= limit
+
+    @property
+    def columns(self) -> List[str]:
+        return unique_columns(self.df.columns)
+
+    def to_json_columns(self, limit: int | None = None) -> dict:
+        """{"columns": [...], "data": {col: [values...]}, "row_count": n} — one list per column."""
+        df = self.df if limit is None else self.df.head(limit)
+        columns = self.columns
+        return {
+            "columns": columns,
+            "data": {c: [_json_value(v) for v in df.iloc[:, i].tolist()] for i, c in enumerate(columns)},
+            "row_count": len(df),
+            "truncated": (limit is not None and len(self.df) > limit) or self.auto_limited,
+            "sql": self.sql,
+        }
+
+    def to_arrow(self):
+        return _pyarrow().Table.from_pandas(self.df.set_axis(self.columns, axis=1), preserve_index=False)
+
+    def to_bytes(self, fmt: str) -> bytes:
+        return b"".join(encode_batches(self.to_arrow().to_batches(), fmt))
+
+    def to_markdown(self, limit: int = 25) -> str:
+        return self.df.head(limit).to_markdown(index=False)
+
+
+class _Chunks(io.RawIOBase):
+    """Write-only sink that hands written bytes back to a generator."""
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.parts.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        out, self.parts = b"".join(self.parts), []
+        return out
+
+
+def _at_least_one(partitions: Iterable[list]) -> Iterator[list]:
+    # An empty result still needs one (empty) batch so the export carries a schema.
+    seen = False
+    for rows in partitions:
+        seen = True
+        yield rows
+    if not seen:
+        yield []
+
+
+def rows_to_batches(columns: List[str], partitions: Iterable[list]) -> Iterator:
+    """
+    Turn DB row partitions into Arrow RecordBatches. The schema is inferred from
+    the first partition (all-null columns become strings) and enforced after.
+    """
+    pa = _pyarrow()
+    columns = unique_columns(columns)
+    schema = None
+    for rows in _at_least_one(partitions):
+        cols = list(zip(*rows)) if rows else [() for _ in columns]
+        if schema is None:
+            arrays = [pa.array(list(c)) for c in cols]
+            arrays = [a.cast(pa.string()) if pa.types.is_null(a.type) else a for a in arrays]
+            schema = pa.schema([pa.field(n, a.type) for n, a in zip(columns, arrays)])
+        else:
+            arrays = [pa.array(list(c), type=f.type) for c, f in zip(cols, schema)]
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def encode_batches(batches: Iterable, fmt: str) -> Iterator[bytes]:
+    """Stream RecordBatches as Arrow IPC (stream format) or Parquet, one chunk per batch."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"unknown export format {fmt!r}; expected one of {sorted(EXPORT_FORMATS)}")
+    pa = _pyarrow()
+    sink, writer = _Chunks(), None
+    for batch in batches:
+        if writer is None:
+            if fmt == "arrow":
+                writer = pa.ipc.new_stream(sink, batch.schema)
+            else:
+                import pyarrow.parquet as pq
+                writer = pq.ParquetWriter(sink, batch.schema)
+        if fmt == "arrow":
+            writer.write_batch(batch)
+        else:
+            writer.write_table(pa.Table.from_batches([batch]))
+        chunk = sink.drain()
+        if chunk:
+            yield chunk
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
@@ -0,0 +1,46 @@
+# query/engines.py
+import os, threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+ENGINE_URL_ENV = {"postgres": "POSTGRES_URL", "mysql": "MYSQL_URL"}
+# psycopg prepares a statement server-side once the same text has run this many
+# times on a connection ("none" disables, e.g. behind a transaction-mode pgbouncer).
+PG_PREPARE_THRESHOLD = os.getenv("PG_PREPARE_THRESHOLD", "1")
+PG_PREPARED_MAX = int(os.getenv("PG_PREPARED_MAX", "256"))
+
+def _connect_args(name: str) -> dict:
+    if name != "postgres":
+        return {}
+    threshold = None if PG_PREPARE_THRESHOLD.lower() in ("", "none") else int(PG_PREPARE_THRESHOLD)
+    return {"prepare_threshold": threshold}
+
+def _on_connect(name: str):
+    def set_prepared_max(dbapi_conn, _record):
+        dbapi_conn.prepared_max = PG_PREPARED_MAX  # per-connection LRU of prepared statements
+    return set_prepared_max if name == "postgres" else None
+
+_engines = {}
+_lock = threading.Lock()
+
+def get_engine(name: str):
+    """Shared SQLAlchemy engine per backend ("postgres" | "mysql"), created on first use."""
+    eng = _engines.get(name)
+    if eng is None:
+        with _lock:
+            eng = _engines.get(name)
+            if eng is None:
+                from sqlalchemy import create_engine, event
+                eng = create_engine(os.getenv(ENGINE_URL_ENV[name]), future=True,
+                                    pool_size=DB_POOL_SIZE, connect_args=_connect_args(name))
+                hook = _on_connect(name)
+                if hook is not None:
+                    event.listen(eng, "connect", hook)
+                _engines[name] = eng
+    return eng
+
+def engine_for(engine_name: str):
+    """Map an engine name from a plan/KG location to its engine (anything but postgres is MySQL)."""
+    return get_engine("postgres" if engine_name == "postgres" else "mysql")
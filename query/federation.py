@@ -1,16 +1,77 @@
-import os
+import time
+
 import pandas as pd
-from sqlalchemy import create_engine, text
-from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from query.columnar import rows_to_batches
+from query.governor import (AUTO_LIMIT, EXPORT_TIMEOUT_MS, STATEMENT_TIMEOUT_MS, QueryCancelled, QueryRejected,
+                            cancel_on, check_plan, is_timeout, set_statement_timeout)
+from query.engines import engine_for
+from query.parameterize import fingerprint, get_statement_stats
+from query.replica import get_replica
+from tools.scheduler import db_gate
 
-load_dotenv()
-PG = create_engine(os.getenv("POSTGRES_URL"), future=True)
-MY = create_engine(os.getenv("MYSQL_URL"), future=True)
+def run_sql(engine_name: str, sql: str, params=None, cancel=None,
+            timeout_ms: int = STATEMENT_TIMEOUT_MS, govern: bool = True,
+            replica: bool = True) -> pd.DataFrame:
+    """
+    Execute one read statement. Postgres reads over replicated, fresh tables are
+    served by the local analytic replica when enabled; everything else runs under
+    the governor: statement timeout, EXPLAIN ceilings (QueryRejected / auto-LIMIT)
+    and cancellation via `cancel` (a threading.Event-like object set when the
+    caller goes away).
+    """
+    eng = engine_for(engine_name)
+    params = params or {}
+    fp, sample, t0 = fingerprint(sql), sql, time.perf_counter()
+    record = lambda source, df=None, error=False: get_statement_stats().record(
+        fp, sample, (time.perf_counter() - t0) * 1000, None if df is None else len(df), error, source)
+    rep = get_replica() if replica and engine_name == "postgres" else None
+    if rep is not None:
+        df = rep.try_serve(sql, params)
+        if df is not None:
+            record("replica", df)
+            df.attrs["source"] = "replica"  # may lag Postgres by up to REPLICA_MAX_LAG_S
+            return df
+    with db_gate.slot(), eng.connect() as c:
+        set_statement_timeout(c, engine_name, timeout_ms)
+        row_limit = None
+        if govern:
+            governed = check_plan(c, engine_name, sql, params)
+            if governed != sql:
+                row_limit, sql = AUTO_LIMIT, governed
+        with cancel_on(eng, engine_name, c, cancel):
+            try:
+                df = pd.read_sql(text(sql), c, params=params)
+            except DBAPIError as e:
+                record(engine_name, error=True)
+                if cancel is not None and cancel.is_set():
+                    raise QueryCancelled("request abandoned; statement cancelled") from e
+                if is_timeout(e):
+                    raise QueryRejected(
+                        f"Rejected by query governor: statement exceeded the {timeout_ms} ms timeout. "
+                        f"Filter earlier, aggregate, and join only on the KG join columns."
+                    ) from e
+                raise
+    record(engine_name, df)
+    if row_limit is not None:
+        df.attrs["row_limit"] = row_limit  # auto-LIMITed by the governor: more rows may exist
+    return df
 
-def run_sql(engine_name: str, sql: str, params=None) -> pd.DataFrame:
-    eng = PG if engine_name=="postgres" else MY
-    with eng.connect() as c:
-        return pd.read_sql(text(sql), c, params=params or {})
+def stream_sql(engine_name: str, sql: str, params=None, batch_rows: int = 50_000,
+               timeout_ms: int = EXPORT_TIMEOUT_MS):
+    """
+    Yield Arrow RecordBatches from a server-side cursor, batch_rows at a time,
+    without materializing a DataFrame. Cost ceilings still apply; the row
+    ceiling does not (exports are bulk by design).
+    """
+    eng = engine_for(engine_name)
+    params = params or {}
+    with db_gate.slot(priority="batch"), eng.connect() as c:  # bulk work never outranks interactive reads
+        set_statement_timeout(c, engine_name, timeout_ms)
+        sql = check_plan(c, engine_name, sql, params, max_rows=None)
+        res = c.execution_options(stream_results=True, yield_per=batch_rows).execute(text(sql), params)
+        yield from rows_to_batches(list(res.keys()), res.partitions())
 
 def stitch(left: pd.DataFrame, right: pd.DataFrame, on_left: str, on_right: str, how="left"):
     return left.merge(right, left_on=on_left, right_on=on_right, how=how, suffixes=("","_r"))
@@ -0,0 +1,125 @@
+# query/governor.py
+"""
+Execution governor for generated SQL: per-statement timeouts, EXPLAIN-based
+cost/row ceilings (reject or auto-LIMIT) and cancellation of running
+statements when the caller goes away.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+STATEMENT_TIMEOUT_MS = int(os.getenv("SQL_STATEMENT_TIMEOUT_MS", "15000"))
+EXPORT_TIMEOUT_MS = int(os.getenv("SQL_EXPORT_TIMEOUT_MS", "300000"))
+MAX_PLAN_COST = float(os.getenv("SQL_MAX_PLAN_COST", "5000000"))
+MAX_PLAN_ROWS = float(os.getenv("SQL_MAX_PLAN_ROWS", "100000"))
+# Plans over MAX_PLAN_ROWS get wrapped in this LIMIT; 0 rejects them instead.
+AUTO_LIMIT = int(os.getenv("SQL_AUTO_LIMIT", "1000"))
+
+
+class QueryRejected(Exception):
+    """
+    The statement was refused before running (plan ceilings, local validation)
+    or killed on timeout. The message is written for the planner's repair prompt.
+    """
+
+
+class QueryCancelled(Exception):
+    """The caller abandoned the request and the running statement was cancelled."""
+
+
+def set_statement_timeout(conn, engine_name: str, timeout_ms: int = STATEMENT_TIMEOUT_MS):
+    if engine_name == "postgres":
+        # SET LOCAL: scoped to the connection's current transaction, so pooled connections stay clean.
+        conn.execute(text(f"SET LOCAL statement_timeout = {int(timeout_ms)}"))
+    else:
+        conn.execute(text(f"SET SESSION max_execution_time = {int(timeout_ms)}"))
+
+
+def explain_estimate(conn, engine_name: str, sql: str, params: dict):
+    """Return (total_cost, estimated_rows) from the planner; rows may be None on MySQL."""
+    if engine_name == "postgres":
+        plan = conn.execute(text("EXPLAIN (FORMAT JSON) " + sql), params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        top = plan[0]["Plan"]
+        return float(top["Total Cost"]), float(top["Plan Rows"])
+    plan = json.loads(conn.execute(text("EXPLAIN FORMAT=JSON " + sql), params).scalar())
+    return float(plan["query_block"].get("cost_info", {}).get("query_cost", 0)), None
+
+
+def check_plan(conn, engine_name: str, sql: str, params: dict, max_rows: float | None = MAX_PLAN_ROWS) -> str:
+    """
+    EXPLAIN the statement and enforce the ceilings. Returns the SQL to run
+    (possibly wrapped in an auto-LIMIT) or raises QueryRejected with a message
+    phrased for the planner's repair prompt. max_rows=None skips the row ceiling.
+    """
+    cost, rows = explain_estimate(conn, engine_name, sql, params)
+    if cost > MAX_PLAN_COST:
+        raise QueryRejected(
+            f"Rejected by query governor: estimated plan cost {cost:,.0f} exceeds the ceiling "
+            f"{MAX_PLAN_COST:,.0f}. Avoid cross joins, join only on the KG join columns, "
+            f"filter early and aggregate instead of returning raw rows."
+        )
+    if max_rows is not None and rows is not None and rows > max_rows:
+        if AUTO_LIMIT:
+            return f"SELECT * FROM ({sql}) AS _governed LIMIT {AUTO_LIMIT}"
+        raise QueryRejected(
+            f"Rejected by query governor: estimated {rows:,.0f} result rows exceeds the ceiling "
+            f"{max_rows:,.0f}. Aggregate, filter or add a LIMIT."
+        )
+    return sql
+
+
+def is_timeout(e: DBAPIError) -> bool:
+    msg = str(getattr(e, "orig", e)).lower()
+    return "statement timeout" in msg or "max_execution_time" in msg or "maximum statement execution time" in msg
+
+
+def _backend_id(conn, engine_name: str):
+    q = "SELECT pg_backend_pid()" if engine_name == "postgres" else "SELECT CONNECTION_ID()"
+    return conn.execute(text(q)).scalar()
+
+
+def _cancel_backend(engine, engine_name: str, backend_id):
+    with engine.connect() as k:
+        if engine_name == "postgres":
+            k.execute(text("SELECT pg_cancel_backend(:pid)"), {"pid": backend_id})
+        else:
+            k.execute(text(f"KILL QUERY {int(backend_id)}"))
+
+
+@contextmanager
+def cancel_on(engine, engine_name: str, conn, cancel):
+    """
+    While the body runs, watch `cancel` (anything with is_set()/wait()) and
+    cancel the statement running on `conn` from a side connection once it fires.
+    """
+    if cancel is None:
+        yield
+        return
+    if cancel.is_set():
+        raise QueryCancelled("request abandoned before execution")
+    backend_id = _backend_id(conn, engine_name)
+    finished = threading.Event()
+    # Held while cancelling so the connection can't go back to the pool mid-cancel.
+    lock = threading.Lock()
+
+    def watch():
+        while not finished.is_set():
+            if cancel.wait(0.1):
+                with lock:
+                    if not finished.is_set():
+                        _cancel_backend(engine, engine_name, backend_id)
+                return
+
+    t = threading.Thread(target=watch, name="sql-cancel-watch", daemon=True)
+    t.start()
+    try:
+        yield
+    finally:
+        with lock:
+            finished.set()
@@ -0,0 +1,184 @@
+# query/parameterize.py
+"""
+Literal -> bind-parameter lifting and statement fingerprints.
+
+LLM-written SQL bakes its literals in (`WHERE "Region" = 'West'`), so every
+variant is a new statement text: Postgres plans each one from scratch and
+psycopg's per-connection prepared-statement cache never gets a second hit.
+`parameterize()` lifts literals in predicate positions (comparisons, IN
+lists, BETWEEN, LIKE, LIMIT/OFFSET) into `:pN` binds. Literals elsewhere stay
+put: in a SELECT list or GROUP BY a bind would stop Postgres from matching
+the two expressions, and ordinals (`GROUP BY 1`) would become constants.
+
+`fingerprint()` hashes the token stream with every literal and bind folded to
+`?`, so "profit in West" and "profit in East" group under one key.
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, List
+
+_TOKEN_RX = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<ident>"(?:""|[^"])*")
+  | (?P<string>'(?:''|[^'])*')
+  | (?P<bind>(?<!:):\w+)
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?(?![\w.]))
+  | (?P<word>[A-Za-z_][\w$.]*)
+  | (?P<op><>|!=|<=|>=|::|\|\||.)
+""", re.VERBOSE | re.DOTALL)
+
+_COMPARE = {"=", "<>", "!=", "<", ">", "<=", ">="}
+_LIFT_AFTER_WORD = {"like", "ilike", "between", "limit", "offset"}
+# `DATE '2021-01-01'`, `INTERVAL '1 day'`: typed literals must stay literals.
+_TYPED_LITERAL = {"date", "time", "timestamp", "timestamptz", "interval"}
+
+
+def _tokens(sql: str):
+    return [(m.lastgroup, m.group()) for m in _TOKEN_RX.finditer(sql)]
+
+
+def _value(kind: str, tok: str):
+    if kind == "string":
+        return tok[1:-1].replace("''", "'")
+    return int(tok) if tok.isdigit() else Decimal(tok)
+
+
+@dataclass
+class Parameterized:
+    sql: str
+    params: Dict[str, object] = field(default_factory=dict)
+    fingerprint: str = ""
+
+
+def parameterize(sql: str, params: dict | None = None) -> Parameterized:
+    """
+    Lift predicate literals out of `sql` into binds (`:p0`, `:p1`, ...).
+    Equal literals share one bind, so a predicate repeated in a CTE or
+    subquery still compares equal. Existing `params` are kept as they are.
+    """
+    toks = _tokens(sql)
+    out = dict(params or {})
+    names: Dict[tuple, str] = {}
+    sig: List[tuple] = []  # significant (kind, lowered token) seen so far
+    depth_in: List[int] = []  # paren depths of open IN (...) lists
+    depth = 0
+    between = False
+    parts: List[str] = []
+
+    for i, (kind, tok) in enumerate(toks):
+        low = tok.lower()
+        if kind in ("string", "number"):
+            prev = sig[-1] if sig else ("", "")
+            nxt = next((t for k, t in toks[i + 1:] if k not in ("ws", "comment")), "")
+            in_list = bool(depth_in) and depth_in[-1] == depth and prev[1] in ("(", ",")
+            lift = (prev[1] in _COMPARE or (prev[0] == "word" and prev[1] in _LIFT_AFTER_WORD)
+                    or (between and prev[1] == "and") or in_list)
+            typed = prev[0] == "word" and prev[1] in _TYPED_LITERAL
+            if lift and not typed and nxt != "::":
+                key = (kind, tok)
+                name = names.get(key)
+                if name is None:
+                    name = names[key] = f"p{len(names)}"
+                    while name in out:  # don't clobber caller binds
+                        name = names[key] = "_" + name
+                    out[name] = _value(kind, tok)
+                if prev[1] == "and":
+                    between = False
+                elif prev[1] == "between":
+                    between = True
+                parts.append(":" + name)
+                sig.append(("bind", "?"))
+                continue
+        if kind == "op" and tok == "(":
+            if sig and sig[-1] == ("word", "in"):
+                depth_in.append(depth + 1)
+            depth += 1
+        elif kind == "op" and tok == ")":
+            if depth_in and depth_in[-1] == depth:
+                depth_in.pop()
+            depth -= 1
+        if kind not in ("ws", "comment"):
+            sig.append((kind, low))
+            if kind == "word" and low == "between":
+                between = True
+        parts.append(tok)
+
+    new_sql = "".join(parts)
+    return Parameterized(sql=new_sql, params=out, fingerprint=fingerprint(new_sql))
+
+
+def fingerprint(sql: str) -> str:
+    """Stable 16-hex key: whitespace, comments, keyword case and all literal/bind values ignored."""
+    norm = []
+    for kind, tok in _tokens(sql):
+        if kind in ("ws", "comment"):
+            continue
+        if kind in ("string", "number", "bind"):
+            norm.append("?")
+        elif kind == "word":
+            norm.append(tok.lower())
+        else:
+            norm.append(tok)
+    # IN (?, ?, ?) and IN (?) are the same statement shape
+    text_ = re.sub(r"\( \?(?: , \?)+ \)", "( ? )", " ".join(norm))
+    return hashlib.sha1(text_.encode()).hexdigest()[:16]
+
+
+class StatementStats:
+    """Per-fingerprint execution counters (bounded, least-recently-seen evicted). Thread-safe."""
+    def __init__(self, max_entries: int = 500):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._by_fp: "OrderedDict[str, dict]" = OrderedDict()
+
+    def record(self, fp: str, sql: str, elapsed_ms: float, rows: int | None = None,
+               error: bool = False, source: str = "postgres"):
+        with self._lock:
+            s = self._by_fp.get(fp)
+            if s is None:
+                s = self._by_fp[fp] = {"sql": sql, "calls": 0, "errors": 0, "rows": 0,
+                                       "total_ms": 0.0, "max_ms": 0.0, "sources": {}}
+                if len(self._by_fp) > self.max_entries:
+                    self._by_fp.popitem(last=False)
+            else:
+                self._by_fp.move_to_end(fp)
+            s["calls"] += 1
+            s["errors"] += int(error)
+            s["rows"] += rows or 0
+            s["total_ms"] += elapsed_ms
+            s["max_ms"] = max(s["max_ms"], elapsed_ms)
+            s["sources"][source] = s["sources"].get(source, 0) + 1
+            s["last_at"] = time.time()
+
+    def top(self, n: int = 20, by: str = "total_ms") -> List[dict]:
+        with self._lock:
+            items = [(fp, dict(s, sources=dict(s["sources"]))) for fp, s in self._by_fp.items()]
+        items.sort(key=lambda kv: kv[1][by], reverse=True)
+        out = []
+        for fp, s in items[:n]:
+            s["fingerprint"] = fp
+            s["mean_ms"] = round(s["total_ms"] / s["calls"], 2)
+            s["total_ms"] = round(s["total_ms"], 2)
+            s["max_ms"] = round(s["max_ms"], 2)
+            out.append(s)
+        return out
+
+    def summary(self) -> dict:
+        with self._lock:
+            calls = sum(s["calls"] for s in self._by_fp.values())
+            return {"fingerprints": len(self._by_fp), "calls": calls,
+                    "reused": calls - len(self._by_fp)}
+
+
+_stats = StatementStats()
+
+def get_statement_stats() -> StatementStats:
+    return _stats
@@ -0,0 +1,379 @@
+# query/replica.py
+"""
+Optional embedded analytic replica of the read-mostly Postgres tables.
+
+Tables are mirrored as Parquet files under REPLICA_DIR and queried in-process
+with DuckDB, so scan-heavy analytics stop competing with Customer Success
+writes on the primary. Disabled unless REPLICA_DIR is set and duckdb is
+installed. run_sql() uses it for read-only statements whose tables are all
+replicated and fresh enough; anything else (or any DuckDB error) goes to
+Postgres.
+
+Refresh is incremental: pg_stat_user_tables change counters tell which tables
+moved; insert-only changes append a new Parquet part (rows past the last seen
+ctid, checked against count(*)), anything else rewrites that table.
+
+    python -m query.replica refresh [--full]
+    python -m query.replica status
+    python -m query.replica bench [--runs 5]
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from sqlalchemy import text
+
+from query.engines import get_engine
+
+REPLICA_DIR = os.getenv("REPLICA_DIR")
+REPLICA_TABLES = [t.strip() for t in os.getenv(
+    "REPLICA_TABLES",
+    "sales.orders,ref.returns,ref.regional_managers,ref.state_managers,"
+    "ref.segment_managers,ref.category_managers,ref.customer_succces_managers",
+).split(",") if t.strip()]
+REPLICA_MAX_LAG_S = float(os.getenv("REPLICA_MAX_LAG_S", "300"))
+REPLICA_REFRESH_S = float(os.getenv("REPLICA_REFRESH_S", "60"))
+FETCH_CHUNK = 100_000
+
+# KG data_type -> DuckDB type, so every Parquet part of a table has the same schema.
+DUCK_TYPES = {"numeric": "DECIMAL(18,4)", "integer": "INTEGER", "bigint": "BIGINT",
+              "date": "DATE", "text": "VARCHAR", "character varying": "VARCHAR"}
+
+_FROM_RX = re.compile(r'(?is)\b(?:from|join)\s+(?P<obj>(?:"[^"]+"|\w+)(?:\.(?:"[^"]+"|\w+))?)')
+_CTE_RX = re.compile(r'(?is)(?:\bwith\s+(?:recursive\s+)?|,\s*)(?P<name>"[^"]+"|\w+)\s+as\s*\(')
+_READONLY_RX = re.compile(r"(?is)^\s*(with|select)\b")
+_WRITE_RX = re.compile(r"(?is)\b(insert|update|delete|merge|for\s+update|for\s+share)\b")
+# FROM inside EXTRACT(YEAR FROM x), SUBSTRING(s FROM 2), TRIM(BOTH FROM s), IS DISTINCT FROM names no table.
+_FN_FROM_RX = re.compile(r"(?is)(\b(?:extract|substring|trim|overlay|position)\s*\([^()]*?\b|\bis\s+(?:not\s+)?distinct\s+)from\b")
+# A bare numeric/decimal is DECIMAL(18,3) on DuckDB (Postgres keeps every digit): ::numeric, CAST(x AS decimal).
+_BARE_NUMERIC_RX = re.compile(r"(?is)(?:::|\bas\s+)\s*(?:numeric|decimal)\b(?!\s*\()")
+_WRITE_TARGET_RX = re.compile(r'(?is)\b(?:insert\s+into|update|delete\s+from)\s+(?P<obj>(?:"[^"]+"|\w+)(?:\.(?:"[^"]+"|\w+))?)')
+
+
+def _duckdb():
+    import duckdb
+    return duckdb
+
+
+def enabled() -> bool:
+    if not REPLICA_DIR:
+        return False
+    try:
+        _duckdb()
+    except ImportError:
+        return False
+    return True
+
+
+class Replica:
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.state_path = self.root / "state.json"
+        self._state: Dict[str, dict] = {}
+        self._state_mtime = 0
+        self._con = None
+        self._views: set = set()
+        self._stale: Dict[str, float] = {}  # table -> time of an in-process write
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    # ---------- state ----------
+
+    def state(self) -> Dict[str, dict]:
+        """Per-table refresh state; re-read when another process refreshed."""
+        try:
+            mtime = self.state_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if mtime != self._state_mtime:
+            self._state = json.loads(self.state_path.read_text())
+            self._state_mtime = mtime
+        return self._state
+
+    def _save_state(self, state: Dict[str, dict]):
+        tmp = self.state_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state, indent=2))
+        os.replace(tmp, self.state_path)
+
+    def lag_s(self, table: str) -> float | None:
+        st = self.state().get(table)
+        return None if st is None else time.time() - st["verified_at"]
+
+    def status(self) -> dict:
+        return {
+            "enabled": True,
+            "hits": self.hits, "misses": self.misses, "errors": self.errors,
+            "tables": {t: {"lag_s": round(self.lag_s(t), 1), "rows": st["rows"], "parts": st["parts"]}
+                       for t, st in self.state().items()},
+        }
+
+    # ---------- serving ----------
+
+    def _table_dir(self, table: str) -> Path:
+        return self.root / table
+
+    def _connection(self):
+        """In-memory DuckDB with one view per refreshed table over its Parquet parts."""
+        missing = [t for t, st in self.state().items() if st["parts"] and t not in self._views]
+        if self._con is None or missing:
+            with self._lock:
+                if self._con is None:
+                    self._con = _duckdb().connect()
+                    # Postgres semantics: int / int truncates, NULLs sort as if larger than any value.
+                    # GLOBAL so per-query cursors inherit them.
+                    self._con.execute("SET GLOBAL integer_division = true")
+                    self._con.execute("SET GLOBAL default_null_order = 'nulls_last_on_asc_first_on_desc'")
+                for table in missing:
+                    schema, name = table.split(".")
+                    glob = str(self._table_dir(table) / "*.parquet").replace("'", "''")
+                    self._con.execute(f'CREATE SCHEMA IF NOT EXISTS "{schema}"')
+                    # Views are re-bound per query, so new parts show up without re-creating them.
+                    self._con.execute(f'CREATE OR REPLACE VIEW "{schema}"."{name}" AS '
+                                      f"SELECT * FROM read_parquet('{glob}')")
+                    self._views.add(table)
+        return self._con
+
+    def mark_stale(self, tables):
+        """A write just landed on `tables`: send their reads to Postgres until the next refresh."""
+        now = time.time()
+        with self._lock:
+            for t in tables:
+                self._stale[t] = now
+
+    def can_serve(self, sql: str) -> bool:
+        if not _READONLY_RX.match(sql) or _WRITE_RX.search(sql) or _BARE_NUMERIC_RX.search(sql):
+            return False
+        ctes = {m.group("name").replace('"', "").lower() for m in _CTE_RX.finditer(sql)}
+        objs = {m.group("obj").replace('"', "") for m in _FROM_RX.finditer(_FN_FROM_RX.sub(r"\1_", sql))}
+        tables = {o for o in objs if o.lower() not in ctes}
+        if not tables:
+            return False
+        state = self.state()
+        for t in tables:
+            lag = self.lag_s(t) if t in REPLICA_TABLES else None
+            if lag is None or lag > REPLICA_MAX_LAG_S or not state[t]["parts"]:
+                return False
+            if self._stale.get(t, 0) >= state[t]["verified_at"]:
+                return False
+        return True
+
+    def query(self, sql: str, params: dict | None = None):
+        """Run on DuckDB; `:name` binds become DuckDB `$name` binds. Returns a DataFrame."""
+        duck_sql = re.sub(r"(?<![:\w]):(\w+)", r"$\1", sql)
+        cur = self._connection().cursor()  # one cursor per call: DuckDB connections aren't shared across threads
+        try:
+            return cur.execute(duck_sql, params or {}).df()
+        finally:
+            cur.close()
+
+    # ---------- refresh ----------
+
+    def _counters(self, conn) -> Dict[str, List[int]]:
+        rows = conn.execute(text(
+            "SELECT schemaname || '.' || relname, n_tup_ins, n_tup_upd, n_tup_del "
+            "FROM pg_stat_user_tables WHERE schemaname || '.' || relname = ANY(:names)"
+        ), {"names": REPLICA_TABLES}).fetchall()
+        return {r[0]: [int(r[1]), int(r[2]), int(r[3])] for r in rows}
+
+    def _casts(self, table: str, columns: List[str]) -> str:
+        from graph.graph_store import get_graph_store
+        gs = get_graph_store()
+        out = []
+        for c in columns:
+            dtype = gs.G.nodes.get(f"{table}.{c}", {}).get("data_type")
+            q = '"' + c.replace('"', '""') + '"'
+            out.append(f"CAST({q} AS {DUCK_TYPES[dtype]}) AS {q}" if dtype in DUCK_TYPES else q)
+        return ", ".join(out)
+
+    def _export(self, conn, table: str, dest: Path, where: str = "", params: dict | None = None):
+        """Copy matching rows into Parquet parts under dest. Returns (rows, max ctid or None)."""
+        import pandas as pd
+        duck = _duckdb().connect()
+        rows, max_ctid, n = 0, None, len(list(dest.glob("*.parquet")))
+        sql = f"SELECT *, ctid::text AS _ctid FROM {table} {where} ORDER BY ctid"
+        for chunk in pd.read_sql(text(sql), conn, params=params or {}, chunksize=FETCH_CHUNK):
+            if chunk.empty:
+                continue
+            max_ctid = chunk["_ctid"].iloc[-1]  # rows arrive ordered by ctid
+            df = chunk.drop(columns=["_ctid"])
+            duck.register("chunk", df)
+            part = dest / f"part-{n:05d}.parquet"
+            tmp = part.with_suffix(".tmp")
+            duck.execute(f"COPY (SELECT {self._casts(table, list(df.columns))} FROM chunk) "
+                         f"TO '{str(tmp).replace(chr(39), chr(39) * 2)}' (FORMAT PARQUET)")
+            duck.unregister("chunk")
+            os.replace(tmp, part)
+            rows += len(df)
+            n += 1
+        duck.close()
+        return rows, max_ctid
+
+    def refresh(self, full: bool = False) -> dict:
+        """
+        Bring every replicated table up to date. Returns {table: "skipped|appended|
+        rewritten|missing"}, or {} when another process holds the refresh lock.
+        """
+        import fcntl
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / ".lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return {}
+            return self._refresh(full)
+
+    def _refresh(self, full: bool) -> dict:
+        state = {t: dict(st) for t, st in self.state().items()}
+        done = {}
+        # verified as of the counter read: a write after it must keep its table stale
+        now = time.time()
+        with get_engine("postgres").connect() as conn:
+            counters = self._counters(conn)
+            for table in REPLICA_TABLES:
+                cur, st = counters.get(table), state.get(table)
+                if cur is None:
+                    done[table] = "missing"
+                    continue
+                if st and not full and cur == st["counters"]:
+                    st["verified_at"] = now
+                    done[table] = "skipped"
+                    continue
+                insert_only = (st and not full and st.get("last_ctid")
+                               and cur[1:] == st["counters"][1:] and cur[0] >= st["counters"][0])
+                if insert_only:
+                    added, max_ctid = self._export(conn, table, self._table_dir(table),
+                                                   "WHERE ctid > CAST(:c AS tid)", {"c": st["last_ctid"]})
+                    total = conn.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+                    if total == st["rows"] + added:
+                        st.update(counters=cur, verified_at=now, rows=total,
+                                  parts=st["parts"] + (1 if added else 0),
+                                  last_ctid=max_ctid or st["last_ctid"])
+                        done[table] = "appended"
+                        continue
+                    # rows landed before the last ctid (reused free space): fall through to a rewrite
+                tmp_dir = self._table_dir(table).with_name(table + ".new")
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                tmp_dir.mkdir(parents=True)
+                rows, max_ctid = self._export(conn, table, tmp_dir)
+                old_dir = self._table_dir(table).with_name(table + ".old")
+                shutil.rmtree(old_dir, ignore_errors=True)
+                if self._table_dir(table).exists():
+                    os.replace(self._table_dir(table), old_dir)
+                os.replace(tmp_dir, self._table_dir(table))
+                shutil.rmtree(old_dir, ignore_errors=True)
+                state[table] = {"counters": cur, "verified_at": now, "rows": rows,
+                                "parts": len(list(self._table_dir(table).glob("*.parquet"))),
+                                "last_ctid": max_ctid}
+                done[table] = "rewritten"
+        self._save_state(state)
+        return done
+
+    def try_serve(self, sql: str, params: dict | None = None):
+        """DataFrame from the replica, or None when the statement must go to Postgres."""
+        if not self.can_serve(sql):
+            self.misses += 1
+            return None
+        try:
+            df = self.query(sql, params)
+        except Exception:  # dialect gaps, a rewrite mid-swap, ...: Postgres answers instead
+            self.errors += 1
+            return None
+        self.hits += 1
+        return df
+
+
+_replica: Replica | None = None
+_replica_lock = threading.Lock()
+
+def get_replica() -> Replica | None:
+    """Process-wide replica, or None when disabled."""
+    global _replica
+    if _replica is None and enabled():
+        with _replica_lock:
+            if _replica is None:
+                _replica = Replica(REPLICA_DIR)
+    return _replica
+
+def note_write(sql: str):
+    """Mark the replicated tables a Postgres write statement touches as stale."""
+    rep = get_replica()
+    if rep is None:
+        return
+    targets = {m.group("obj").replace('"', "") for m in _WRITE_TARGET_RX.finditer(sql)}
+    rep.mark_stale(t for t in REPLICA_TABLES if t in targets or t.split(".")[1] in targets)
+
+def start_refresher() -> threading.Thread | None:
+    """Refresh every REPLICA_REFRESH_S seconds in a daemon thread (one process at a time wins the lock)."""
+    rep = get_replica()
+    if rep is None or REPLICA_REFRESH_S <= 0:
+        return None
+
+    def loop():
+        while True:
+            try:
+                rep.refresh()
+            except Exception as e:
+                print(f"replica refresh failed: {type(e).__name__}: {e}")
+            time.sleep(REPLICA_REFRESH_S)
+
+    t = threading.Thread(target=loop, name="replica-refresh", daemon=True)
+    t.start()
+    return t
+
+
+# Scan-heavy aggregates typical of the data-access path.
+BENCH_QUERIES = {
+    "profit_by_region": 'SELECT "Region", SUM("Sales") AS sales, SUM("Profit") AS profit FROM sales.orders GROUP BY "Region"',
+    "top_customers": 'SELECT "Customer Name", SUM("Sales") AS s FROM sales.orders GROUP BY "Customer Name" ORDER BY s DESC LIMIT 10',
+    "monthly_sales": 'SELECT date_trunc(\'month\', "Order Date") AS m, SUM("Sales") FROM sales.orders GROUP BY 1 ORDER BY 1',
+    "returns_by_category": 'SELECT o."Category", COUNT(*) FROM sales.orders o JOIN ref.returns r ON o."Order ID" = r."ID" GROUP BY o."Category"',
+    "state_manager_profit": 'SELECT s."Manager", SUM(o."Profit") FROM sales.orders o JOIN ref.state_managers s ON o."State/Province" = s."State/Province" GROUP BY s."Manager"',
+}
+
+def bench(runs: int = 5) -> dict:
+    """Median wall time (ms) per query on Postgres vs the replica."""
+    import statistics
+    import pandas as pd
+    rep = get_replica()
+    if rep is None:
+        raise RuntimeError("replica disabled: set REPLICA_DIR and install duckdb")
+    out = {}
+    with get_engine("postgres").connect() as conn:
+        for name, sql in BENCH_QUERIES.items():
+            timings = {"postgres": [], "replica": []}
+            for _ in range(runs):
+                t0 = time.perf_counter(); pd.read_sql(text(sql), conn); timings["postgres"].append(time.perf_counter() - t0)
+                t0 = time.perf_counter(); rep.query(sql); timings["replica"].append(time.perf_counter() - t0)
+            pg, dk = (statistics.median(v) * 1000 for v in timings.values())
+            out[name] = {"postgres_ms": round(pg, 2), "replica_ms": round(dk, 2), "speedup": round(pg / dk, 1) if dk else None}
+    return out
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="Analytic replica maintenance")
+    ap.add_argument("cmd", choices=["refresh", "status", "bench"])
+    ap.add_argument("--full", action="store_true", help="refresh: rewrite every table")
+    ap.add_argument("--runs", type=int, default=5, help="bench: runs per query")
+    args = ap.parse_args()
+    rep = get_replica()
+    if rep is None:
+        raise SystemExit("replica disabled: set REPLICA_DIR and install duckdb")
+    if args.cmd == "refresh":
+        print(json.dumps(rep.refresh(full=args.full), indent=2))
+    elif args.cmd == "status":
+        print(json.dumps(rep.status(), indent=2))
+    else:
+        for name, r in bench(args.runs).items():
+            print(f"{name:24} postgres {r['postgres_ms']:>9} ms   replica {r['replica_ms']:>9} ms   x{r['speedup']}")
+
+if __name__ == "__main__":
+    main()
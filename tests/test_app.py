@@ -0,0 +1,32 @@
+# tests/test_app.py
+import pytest
+from fastapi.testclient import TestClient
+
+import app as app_mod
+from query import federation
+from query.governor import QueryRejected
+
+
+class _DA:
+    def resolve_sql(self, message):
+        return "SELECT * FROM sales.orders"
+
+
+class _Router:
+    da = _DA()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app_mod, "get_router", lambda: _Router())
+    return TestClient(app_mod.app)
+
+
+def test_export_over_budget_is_422_not_empty_200(client, monkeypatch):
+    def stream_sql(engine_name, sql):
+        raise QueryRejected("Rejected by query governor: estimated plan cost exceeds the ceiling")
+        yield  # a generator, like the real one: nothing runs until first read
+
+    monkeypatch.setattr(federation, "stream_sql", stream_sql)
+    r = client.post("/export", json={"message": "every order", "format": "arrow"})
+    assert r.status_code == 422 and "plan cost" in r.json()["detail"]
@@ -0,0 +1,45 @@
+# tests/test_build_graph.py
+import pytest
+
+from graph import build_graph
+from graph.graph_store import GraphStore
+
+TABLES = {
+    "sales.orders": [("Order ID", "text"), ("Region", "text")],
+    "ref.returns": [("ID", "text")],
+    "ref.regional_managers": [("Regions", "text")],
+}
+
+
+@pytest.fixture
+def gs(tmp_path, monkeypatch):
+    def introspect(known, full=False):
+        live = {}
+        for fqn, cols in TABLES.items():
+            schema, table = fqn.split(".")
+            meta = {"location": {"engine": "postgres", "schema": schema, "table": table}, "ddl_hash": fqn}
+            if full or known.get(fqn) != fqn:
+                meta["columns"] = cols
+            live[fqn] = meta
+        return live
+
+    monkeypatch.setattr(build_graph, "introspect", introspect)
+    store = GraphStore(tmp_path / "kg.json")
+    build_graph.refresh(store)
+    return store
+
+
+def joins(gs):
+    return sorted((u, v) for u, v, d in gs.G.edges(data=True) if d.get("type") == "join")
+
+
+def test_hint_changes_apply_without_ddl_changes(gs, monkeypatch):
+    monkeypatch.setattr(build_graph, "JOIN_HINTS", [("sales.orders", "ref.returns", [["Order ID", "ID"]])])
+    assert build_graph.refresh(gs)["changed"] == []
+    assert joins(gs) == [("ref.returns", "sales.orders"), ("sales.orders", "ref.returns")]
+
+    monkeypatch.setattr(build_graph, "JOIN_HINTS", build_graph.JOIN_HINTS +
+                        [("sales.orders", "ref.regional_managers", [["Region", "Regions"]])])
+    build_graph.refresh(gs)
+    assert ("sales.orders", "ref.regional_managers") in joins(gs)
+    assert gs.G.edges["sales.orders", "ref.regional_managers"]["on"] == [["Region", "Regions"]]
@@ -0,0 +1,38 @@
+# tests/test_columnar.py
+import pandas as pd
+import pytest
+
+from query.columnar import QueryResult, unique_columns
+
+# e.g. orders JOIN state_managers: both sides carry "State/Province"
+DF = pd.DataFrame([[1, "Texas", "Texas"]], columns=["Order ID", "State/Province", "State/Province"])
+
+
+def test_unique_columns_suffixes_without_clobbering():
+    assert unique_columns(["a", "a", "a_2", "b", "a"]) == ["a", "a_3", "a_2", "b", "a_4"]
+
+
+def test_json_columns_keep_duplicate_columns():
+    out = QueryResult(DF).to_json_columns()
+    assert out["columns"] == ["Order ID", "State/Province", "State/Province_2"]
+    assert out["data"]["State/Province_2"] == ["Texas"]
+
+
+def test_export_with_duplicate_columns():
+    pytest.importorskip("pyarrow")
+    res = QueryResult(DF)
+    assert res.to_arrow().schema.names == res.columns
+    assert res.to_bytes("parquet")
+
+
+def test_auto_limit_reports_truncated():
+    df = pd.DataFrame({"x": range(3)})
+    df.attrs["row_limit"] = 3
+    assert QueryResult(df).to_json_columns()["truncated"] is True
+    df.attrs["row_limit"] = 10  # limit not reached: nothing was cut
+    assert QueryResult(df).to_json_columns()["truncated"] is False
+
+
+def test_null_dates_serialise_as_null():
+    df = pd.DataFrame({"Ship Date": pd.to_datetime(["2021-01-05", None])})
+    assert QueryResult(df).to_json_columns()["data"]["Ship Date"] == ["2021-01-05T00:00:00", None]
@@ -0,0 +1,99 @@
+# tests/test_data_access.py
+import pytest
+
+from agents.data_access import DataAccessAgent, check_joins_with_graph, get_graph_store
+from agents.models import _StubReply
+from tools.scheduler import Overloaded
+from tools.singleflight import normalize_message
+
+SQL = 'SELECT "Region", SUM("Profit") FROM sales.orders WHERE "Region" = \'West\' GROUP BY "Region"'
+
+
+class _Planner:
+    def __init__(self):
+        self.calls = 0
+
+    def run(self, prompt):
+        self.calls += 1
+        return _StubReply(f"```sql\n{SQL}\n```")
+
+
+def overloaded(stmt):
+    raise Overloaded("db", "interactive", 3)
+
+
+@pytest.fixture
+def da():
+    agent = DataAccessAgent("stub:0")
+    agent.agent = agent.repairer = _Planner()
+    return agent
+
+
+def test_overloaded_db_is_not_a_planning_error(da):
+    with pytest.raises(Overloaded):
+        da._plan_and_execute("profit in West", overloaded)
+    assert da.agent.calls == 1  # no LLM repair round on back-pressure
+
+
+def test_overloaded_reuse_does_not_replan(da):
+    da.plans.add("profit in West", SQL)
+    with pytest.raises(Overloaded):
+        da._plan_and_execute("profit in East", overloaded)
+    assert da.agent.calls == 0
+
+
+CHAIN = ('SELECT r."Regional Manager" FROM sales.orders o '
+         'JOIN ref.customer_succces_managers c ON o."Region" = c."Regions" JOIN ref.regional_managers r ON ')
+
+
+@pytest.mark.parametrize("sql, ok", [
+    (CHAIN + 'c."Regions" = r."Regions"', True),              # implied through orders.Region
+    (CHAIN + 'o."Region" = r."Regions"', True),               # direct KG hint
+    (CHAIN + 'c."Regions" = r."Regional Manager"', False),    # not a KG column pair
+    ('SELECT 1 FROM ref.customer_succces_managers c '
+     'JOIN ref.regional_managers r ON c."Regions" = r."Regions"', False),  # chain table missing
+    ('SELECT 1 FROM sales.orders o JOIN ref.returns r ON o."Region" = r."ID"', False),
+    ('SELECT o."Region", SUM(o."Sales") / t.total FROM sales.orders o '
+     'CROSS JOIN (SELECT SUM("Sales") AS total FROM sales.orders) t GROUP BY o."Region", t.total', True),
+    ('SELECT 1 FROM (SELECT 1 FROM ref.returns) x CROSS JOIN (SELECT 2 FROM sales.orders) y', True),
+    ('SELECT 1 FROM sales.orders o CROSS JOIN ref.returns r', False),
+    ('SELECT 1 FROM (SELECT * FROM sales.orders CROSS JOIN ref.returns) t', False),
+])
+def test_join_check(sql, ok):
+    assert (check_joins_with_graph(sql, get_graph_store()) == []) is ok
+
+
+def test_replica_results_are_not_cached(da):
+    import pandas as pd
+
+    def execute(stmt, cancel=None):
+        df = pd.DataFrame({"Region": ["West"], "sum": [1.0]})
+        df.attrs["source"] = "replica"
+        return df
+
+    da._execute = execute
+    da.query("profit in West")
+    assert da.answers.get(normalize_message("profit in West")) is None
+    da._execute = lambda stmt, cancel=None: pd.DataFrame({"Region": ["West"], "sum": [1.0]})
+    da.query("profit in West")
+    assert da.answers.get(normalize_message("profit in West")) is not None
+
+
+def test_change_poll_runs_without_warming(da, monkeypatch):
+    from agents import cache_warmer
+    monkeypatch.setattr(cache_warmer, "WARMER_ENABLED", False)
+    w = cache_warmer.CacheWarmer(da)
+    monkeypatch.setattr(w, "_loop", lambda: None)
+    assert w.start() is not None
+
+
+def test_failed_repair_is_a_planning_error(da):
+    from agents.data_access import PlanningError
+    from query.governor import QueryRejected
+
+    def rejected(stmt):
+        raise QueryRejected("Rejected by query governor: estimated plan cost too high")
+
+    with pytest.raises(PlanningError, match="after repair"):
+        da._plan_and_execute("profit in West", rejected)
+    assert da.agent.calls == 2  # plan + one repair, then give up
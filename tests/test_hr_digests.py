@@ -0,0 +1,18 @@
+# tests/test_hr_digests.py
+from agents.human_resources import EscalationDigests
+
+
+def draft(text):
+    return {"to": "mgr@example.com", "subject": "Escalation: returns and refunds", "body": text,
+            "request_text": text}
+
+
+def test_one_email_per_manager_window():
+    sent = []
+    d = EscalationDigests(window_s=60, send=lambda *a: sent.append(a))
+    d.add(draft("refund for order 1"), "returns", "a@example.com")
+    d.add(draft("refund for order 2"), "returns", "b@example.com")
+    d.flush()
+    assert len(sent) == 1 and "2 escalations" in sent[0][1]
+    assert d.stats() == {"window_s": 60, "queued": 2, "pending": 0, "emails_sent": 1,
+                         "send_failures": 0, "emails_saved": 1}
@@ -0,0 +1,164 @@
+# tests/test_models.py
+import threading
+
+import pytest
+
+from agents import models
+from agents.models import LazyAgent, ModelHealth, ModelUnavailable
+from tools import scheduler
+from tools.scheduler import Gate, Overloaded
+
+
+class _Out:
+    def __init__(self, content="ok", status=None):
+        self.content, self.status = content, status
+
+
+class _Scripted:
+    """Fake agno agent: returns/raises the queued outcomes in order, then repeats the last one."""
+    def __init__(self, *outcomes):
+        self.outcomes, self.calls = list(outcomes), 0
+
+    def run(self, prompt):
+        self.calls += 1
+        o = self.outcomes.pop(0) if len(self.outcomes) > 1 else self.outcomes[0]
+        if isinstance(o, Exception):
+            raise o
+        return o
+
+
+@pytest.fixture(autouse=True)
+def fresh_health(monkeypatch):
+    monkeypatch.setattr(models, "_health", {})
+    monkeypatch.setattr(models, "CB_MIN_CALLS", 3)
+    monkeypatch.setattr(models, "CB_COOLDOWN_S", 0.05)
+    monkeypatch.setattr(models, "llm_gate", Gate("llm", 4))
+
+
+def agent_with(chain, **fakes):
+    la = LazyAgent("test")
+    la.chain = chain
+    la._agents.update(fakes)
+    return la
+
+
+def test_primary_serves_when_healthy():
+    la = agent_with(["stub:0", "stub:1"])
+    la.run("hi")
+    assert la.last_model == "stub:0"
+
+
+def test_fails_over_in_chain_order():
+    la = agent_with(["stub:0:1", "stub:0:1#b", "stub:0"],
+                    **{"stub:0:1#b": _Scripted(RuntimeError("down"))})
+    assert la.run("hi").content == "ok"
+    assert la.last_model == "stub:0"
+    assert models.health()["stub:0:1"]["errors"] == 1
+    assert models.health()["stub:0:1#b"]["errors"] == 1
+
+
+def test_breaker_opens_on_errors_and_skips_model():
+    la = agent_with(["stub:0:1", "stub:0"])
+    for _ in range(5):
+        la.run("hi")
+    h = models.health()["stub:0:1"]
+    assert h["state"] == "open"
+    assert h["calls"] == 3  # skipped once open
+    assert models.health()["stub:0"]["calls"] == 5
+
+
+def test_breaker_opens_on_latency():
+    models._health["stub:20"] = ModelHealth("stub:20", slow_s=0.005)
+    la = agent_with(["stub:20", "stub:0"])
+    for _ in range(4):
+        la.run("hi")
+    assert models.health()["stub:20"]["state"] == "open"
+    assert la.last_model == "stub:0"
+
+
+def test_half_open_trial_closes_on_success(monkeypatch):
+    primary = _Scripted(RuntimeError("down"), RuntimeError("down"), RuntimeError("down"), _Out("back"))
+    la = agent_with(["p", "stub:0"], p=primary)
+    for _ in range(3):
+        la.run("hi")
+    assert models.get_health("p").state == "open"
+    monkeypatch.setattr(models.time, "monotonic", lambda t=models.time.monotonic(): t + 1)
+    assert la.run("hi").content == "back"
+    assert models.get_health("p").state == "closed"
+
+
+def test_half_open_trial_reopens_on_failure(monkeypatch):
+    la = agent_with(["p", "stub:0"], p=_Scripted(RuntimeError("down")))
+    for _ in range(3):
+        la.run("hi")
+    h = models.get_health("p")
+    opened = h.opened_at
+    monkeypatch.setattr(models.time, "monotonic", lambda: opened + 1)
+    la.run("hi")
+    assert h.state == "open" and h.trips == 2
+    assert la.last_model == "stub:0"
+
+
+def test_agno_error_status_counts_as_failure():
+    # agno swallows provider errors and returns RunOutput(status=ERROR, content=<error text>)
+    from agno.run.base import RunStatus
+    la = agent_with(["p", "stub:0"], p=_Scripted(_Out("429 quota exceeded", status=RunStatus.error)))
+    out = la.run("hi")
+    assert out.content == "ok" and la.last_model == "stub:0"
+    assert models.get_health("p").errors == 1
+
+
+def test_empty_output_counts_as_failure():
+    la = agent_with(["p", "stub:0"], p=_Scripted(_Out(content="")))
+    la.run("hi")
+    assert la.last_model == "stub:0"
+    assert models.get_health("p").errors == 1
+
+
+def test_all_failing_raises_model_unavailable():
+    la = agent_with(["stub:0:1"])
+    with pytest.raises(ModelUnavailable):
+        la.run("hi")
+
+
+def test_overloaded_gate_does_not_wedge_half_open_trial(monkeypatch):
+    gate = Gate("llm", 1)
+    monkeypatch.setattr(models, "llm_gate", gate)
+    monkeypatch.setitem(scheduler.QUEUE_DEADLINE_S, "interactive", 0.01)
+    la = agent_with(["p"], p=_Scripted(RuntimeError("down"), RuntimeError("down"), RuntimeError("down"), _Out("back")))
+    for _ in range(3):
+        with pytest.raises(ModelUnavailable):
+            la.run("hi")
+    h = models.get_health("p")
+    monkeypatch.setattr(models.time, "monotonic", lambda: h.opened_at + 1)
+    with gate.slot():  # provider quota is full: the trial call is rejected before it starts
+        with pytest.raises(Overloaded):
+            la.run("hi")
+    assert not h._trial
+    assert la.run("hi").content == "back"
+    assert h.state == "closed"
+
+
+class _Hangs:
+    def __init__(self):
+        self.release = threading.Event()
+
+    def run(self, prompt):
+        self.release.wait(5)
+        return _Out("too late")
+
+
+def test_hung_call_times_out_fails_over_and_frees_its_slot(monkeypatch):
+    gate = Gate("llm", 1)
+    monkeypatch.setattr(models, "llm_gate", gate)
+    monkeypatch.setattr(models, "CALL_TIMEOUT_S", 0.05)
+    hung = _Hangs()
+    la = agent_with(["p", "stub:0"], p=hung)
+    try:
+        for _ in range(3):
+            assert la.run("hi").content == "ok" and la.last_model == "stub:0"
+        h = models.get_health("p")
+        assert h.errors == 3 and h.state == "open"
+        assert gate.stats()["in_use"] == 0  # the hung call doesn't keep the slot
+    finally:
+        hung.release.set()
@@ -0,0 +1,77 @@
+# tests/test_parameterize.py
+import re
+
+import pytest
+
+from query.parameterize import fingerprint, parameterize
+
+Q = 'SELECT * FROM sales.orders WHERE '
+
+
+@pytest.mark.parametrize("sql, expected_sql, params", [
+    # BETWEEN lifts both bounds, and its AND doesn't make the next AND a lift position
+    (Q + '"Sales" BETWEEN 10 AND 20 AND "Region" = \'West\'',
+     Q + '"Sales" BETWEEN :p0 AND :p1 AND "Region" = :p2', {"p0": 10, "p1": 20, "p2": "West"}),
+    (Q + '"Sales" BETWEEN 10 AND 20 AND 5 < "Quantity"',
+     Q + '"Sales" BETWEEN :p0 AND :p1 AND 5 < "Quantity"', {"p0": 10, "p1": 20}),
+    # IN lists, and a nested IN subquery's own predicate
+    (Q + '"Region" IN (\'West\', \'East\') AND "Quantity" IN (SELECT q FROM t WHERE x = 3)',
+     Q + '"Region" IN (:p0, :p1) AND "Quantity" IN (SELECT q FROM t WHERE x = :p2)',
+     {"p0": "West", "p1": "East", "p2": 3}),
+    # typed literals stay literals
+    (Q + '"Order Date" >= DATE \'2021-01-01\' AND "Order Date" < \'2022-01-01\'::date '
+         'AND "Ship Date" > "Order Date" + INTERVAL \'3 days\'',
+     None, {}),
+    (Q + '"Order Date" >= TIMESTAMP \'2021-01-01 00:00\'', None, {}),
+    # LIKE, quotes inside strings, LIMIT/OFFSET
+    (Q + '"Customer Name" LIKE \'A%\' AND "Note" = \'it\'\'s\' LIMIT 10 OFFSET 5',
+     Q + '"Customer Name" LIKE :p0 AND "Note" = :p1 LIMIT :p2 OFFSET :p3',
+     {"p0": "A%", "p1": "it's", "p2": 10, "p3": 5}),
+    # ordinals and select-list constants stay put
+    ('SELECT "Region", 1 AS one, SUM("Sales") FROM sales.orders GROUP BY 1 ORDER BY 3 DESC', None, {}),
+    # literals in identifiers and comments are not literals
+    (Q + '"Region" = "West" -- = \'East\'', None, {}),
+])
+def test_parameterize(sql, expected_sql, params):
+    p = parameterize(sql)
+    assert p.sql == (sql if expected_sql is None else expected_sql)
+    assert p.params == params
+
+
+def test_case_in_select_and_group_by_stay_identical():
+    case = 'CASE WHEN "Profit" > 0 THEN \'gain\' ELSE \'loss\' END'
+    p = parameterize(f'SELECT {case} AS k, COUNT(*) FROM sales.orders WHERE "Region" = \'West\' GROUP BY {case}')
+    select_expr, group_expr = re.search(r"SELECT (.*) AS k.*GROUP BY (.*)$", p.sql).groups()
+    assert select_expr == group_expr  # Postgres must still see the GROUP BY expression in the SELECT list
+    assert "'gain'" in select_expr and "'loss'" in select_expr
+
+
+def test_equal_literals_share_a_bind():
+    p = parameterize('WITH w AS (SELECT * FROM sales.orders WHERE "Region" = \'West\') '
+                     'SELECT * FROM w WHERE "Region" = \'West\' AND "Segment" = \'West\'')
+    assert p.sql.count(":p0") == 3 and p.params == {"p0": "West"}
+
+
+def test_caller_binds_are_kept():
+    p = parameterize(Q + '"Region" = :p0 AND "Segment" = \'Consumer\'', {"p0": "West"})
+    assert p.params == {"p0": "West", "_p0": "Consumer"}
+    assert p.sql.endswith('"Segment" = :_p0')
+
+
+@pytest.mark.parametrize("a, b", [
+    (Q + '"Region" = \'West\'', Q + '"Region" = \'East\''),
+    (Q + '"Region" IN (\'West\', \'East\')', Q + '"Region" IN (\'South\')'),
+    (Q + '"Sales" > 10', 'select *  from sales.orders\nwhere "Sales" > 99.5 -- big ones'),
+    (Q + '"Sales" > 10', Q + '"Sales" > :p0'),
+])
+def test_fingerprint_ignores_literal_variants(a, b):
+    assert fingerprint(a) == fingerprint(b)
+    assert parameterize(a).fingerprint == parameterize(b).fingerprint
+
+
+@pytest.mark.parametrize("a, b", [
+    (Q + '"Region" = \'West\'', Q + '"Segment" = \'West\''),
+    (Q + '"Sales" > 10', Q + '"Sales" < 10'),
+])
+def test_fingerprint_keeps_shape(a, b):
+    assert fingerprint(a) != fingerprint(b)
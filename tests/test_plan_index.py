@@ -0,0 +1,103 @@
+# tests/test_plan_index.py
+import threading
+
+import pytest
+
+from agents.plan_index import PlanIndex, extract_slots, substitute_slots, words_compatible
+
+PLANS = {
+    "orders returned in West":
+        'SELECT count(*) FROM sales.orders o JOIN ref.returns r ON o."Order ID" = r."ID" WHERE o."Region" = \'West\'',
+    "total sales by region": 'SELECT "Region", SUM("Sales") FROM sales.orders GROUP BY "Region"',
+    "top 5 states by sales":
+        'SELECT "State/Province", SUM("Sales") AS s FROM sales.orders GROUP BY 1 ORDER BY s DESC LIMIT 5',
+    "profit by region": 'SELECT "Region", SUM("Profit") FROM sales.orders GROUP BY "Region"',
+    "most profitable products in West":
+        'SELECT "Product Name", SUM("Profit") AS p FROM sales.orders WHERE "Region" = \'West\' '
+        'GROUP BY 1 ORDER BY p DESC LIMIT 10',
+    "orders shipped in 2017":
+        'SELECT count(*) FROM sales.orders WHERE "Ship Date" >= \'2017-01-01\' AND "Ship Date" < \'2018-01-01\'',
+    "sales in Texas for 2021":
+        'SELECT SUM("Sales") FROM sales.orders WHERE "State/Province" = \'Texas\' '
+        'AND "Order Date" >= \'2021-01-01\' AND "Order Date" < \'2022-01-01\'',
+}
+
+
+@pytest.fixture(params=[1, 1000], ids=["frozen", "pending"])
+def index(request):
+    idx = PlanIndex(rebuild_every=request.param)
+    for q, sql in PLANS.items():
+        idx.add(q, sql)
+    return idx
+
+
+@pytest.mark.parametrize("question, matched", [
+    ("orders returned in East", "orders returned in West"),
+    ("region-wise profit", "profit by region"),
+    ("what's profit per regions?", "profit by region"),
+    ("top 3 states by sales", "top 5 states by sales"),
+    ("most proftable products in East", "most profitable products in West"),  # typo
+])
+def test_paraphrases_match(index, question, matched):
+    m = index.lookup(question)
+    assert m is not None and m.matched_question == matched
+
+
+@pytest.mark.parametrize("question", [
+    "orders not returned in East",   # negation
+    "total quantity by region",      # different measure
+    "bottom 5 states by sales",      # opposite direction
+    "profit by category",            # different dimension
+    "average profit by region",      # different aggregate
+    "most unprofitable products in East",  # negation prefix, not a typo
+    "orders unshipped in 2018",
+])
+def test_near_misses_do_not_match(index, question):
+    assert index.lookup(question) is None
+
+
+def test_stored_words_are_not_typos():
+    q, d = frozenset({"order", "returned"}), frozenset({"order", "return"})
+    assert words_compatible(q, d)
+    assert not words_compatible(q, d, known={"order", "returned", "return"})
+
+
+def test_slots_are_substituted(index):
+    m = index.lookup("top 3 states by sales")
+    assert m.sql.endswith("LIMIT 3")
+    m = index.lookup("sales in Ohio for 2020")
+    assert "'Ohio'" in m.sql and "'2020-01-01'" in m.sql and "'2021-01-01'" in m.sql
+
+
+def test_substitution_refuses_missing_literal():
+    _, old = extract_slots("profit in West")
+    _, new = extract_slots("profit in East")
+    assert substitute_slots('SELECT SUM("Profit") FROM sales.orders', old, new) is None
+
+
+def test_lookups_do_not_wait_for_rebuild():
+    idx = PlanIndex(rebuild_every=10**9)
+    for q, sql in PLANS.items():
+        idx.add(q, sql)
+    started, release = threading.Event(), threading.Event()
+    build = PlanIndex._build
+
+    def slow_build(tfs, vocab):
+        started.set()
+        release.wait(5)
+        return build(tfs, vocab)
+
+    idx._build = slow_build
+    t = threading.Thread(target=idx._rebuild)
+    t.start()
+    try:
+        assert started.wait(5)
+        done = []
+        reader = threading.Thread(target=lambda: done.append(idx.lookup("region-wise profit")))
+        reader.start()
+        reader.join(1)
+        assert done and done[0] is not None  # answered while the build is still blocked
+    finally:
+        release.set()
+        t.join()
+    assert idx._n_frozen == len(PLANS)
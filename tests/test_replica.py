@@ -0,0 +1,58 @@
+# tests/test_replica.py
+import json
+import time
+
+import pytest
+
+pytest.importorskip("duckdb")
+
+from query import replica as replica_mod
+from query.replica import Replica
+
+
+@pytest.fixture
+def replica(tmp_path):
+    import duckdb
+    part = tmp_path / "sales.orders"
+    part.mkdir()
+    duckdb.connect().execute(
+        "COPY (SELECT * FROM (VALUES (7, 2, 1.0), (1, 1, NULL)) t(\"Quantity\", \"Orders\", \"Profit\")) "
+        f"TO '{part / '0.parquet'}' (FORMAT PARQUET)")
+    (tmp_path / "state.json").write_text(json.dumps(
+        {"sales.orders": {"parts": 1, "rows": 2, "verified_at": time.time()}}))
+    return Replica(str(tmp_path))
+
+
+def test_integer_division_matches_postgres(replica):
+    df = replica.query('SELECT "Quantity" / "Orders" AS q, -"Quantity" / "Orders" AS n, '
+                       '"Quantity" / 2.0 AS f FROM sales.orders WHERE "Orders" = 2')
+    assert (df.q[0], df.n[0], df.f[0]) == (3, -3, 3.5)
+
+
+def test_nulls_sort_first_on_desc_like_postgres(replica):
+    df = replica.query('SELECT "Profit" FROM sales.orders ORDER BY "Profit" DESC')
+    assert df.Profit.isna().tolist() == [True, False]
+
+
+@pytest.mark.parametrize("sql, ok", [
+    ('SELECT EXTRACT(YEAR FROM "Order Date") AS y, SUM("Sales") FROM sales.orders GROUP BY 1', True),
+    ('SELECT SUBSTRING("Region" FROM 1 FOR 1) FROM sales.orders', True),
+    ('SELECT 1 FROM sales.orders WHERE "Region" IS DISTINCT FROM \'West\'', True),
+    ('SELECT ROUND((SUM("Profit") / SUM("Sales"))::numeric, 4) FROM sales.orders', False),
+    ('SELECT CAST(SUM("Profit") AS decimal) FROM sales.orders', False),
+    ('SELECT ROUND(SUM("Profit")::numeric(12, 4), 4) FROM sales.orders', True),
+    ('SELECT 1 FROM sales.orders o JOIN ref.returns r ON o."Order ID" = r."ID"', False),  # not replicated here
+])
+def test_can_serve(replica, sql, ok):
+    assert replica.can_serve(sql) is ok
+
+
+def test_write_keeps_table_on_postgres_until_refresh(replica, monkeypatch):
+    sql = 'SELECT SUM("Profit") FROM sales.orders'
+    monkeypatch.setattr(replica_mod, "get_replica", lambda: replica)
+    replica_mod.note_write('INSERT INTO sales.orders ("Order ID") VALUES (:id)')
+    assert not replica.can_serve(sql)
+    state = json.loads(replica.state_path.read_text())
+    state["sales.orders"]["verified_at"] = time.time() + 1  # refreshed after the write
+    replica._save_state(state)
+    assert replica.can_serve(sql)
@@ -0,0 +1,55 @@
+# tests/test_router.py
+import threading
+import time
+
+from agents.router import Router
+
+
+class _CS:
+    def __init__(self):
+        self.calls = 0
+
+    def act(self, msg, confirmed=False):
+        self.calls += 1
+        return "SUCCESS: order created"
+
+
+def test_identical_writes_share_routing_but_run_once_each():
+    r = Router()
+    routed = []
+
+    def classify(msg):
+        routed.append(msg)
+        time.sleep(0.1)  # keep the first call in flight while the others arrive
+        return "customer_success"
+
+    r.classify = classify
+    r.__dict__["cs"] = cs = _CS()
+    threads = [threading.Thread(target=r.handle, args=("Create an order for Acme",)) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert cs.calls == 3
+    assert len(routed) < 3
+
+
+class _DA:
+    def __init__(self):
+        self.calls = 0
+
+    def answer(self, msg, cancel=None):
+        self.calls += 1
+        return "| x |"
+
+
+def test_batch_shares_data_answers_but_not_writes():
+    r = Router()
+    r.classify_many = lambda msgs: ["customer_success" if "order" in m else "data_access" for m in msgs]
+    r.__dict__["cs"], r.__dict__["da"] = cs, da = _CS(), _DA()
+    r._warmer = type("_Warmer", (), {"notify_change": lambda self: None})()
+    out = r.handle_batch([{"message": "Create an order for Acme", "confirmed": True}] * 2 +
+                         [{"message": "profit by region"}] * 2)
+    assert [x["reply"] for x in out["results"]][:2] == ["SUCCESS: order created"] * 2
+    assert cs.calls == 2 and da.calls == 1
+    assert out["stats"]["executed"] == 3
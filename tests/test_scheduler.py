@@ -0,0 +1,87 @@
+# tests/test_scheduler.py
+import threading
+import time
+
+import pytest
+
+from tools import scheduler
+from tools.scheduler import Gate, Overloaded
+
+
+@pytest.fixture
+def gate():
+    g = Gate("db", 1)
+    g._hold_s = 0.01
+    g.acquire("interactive", "holder")  # every test starts with the only slot taken
+    return g
+
+
+def queued(g):
+    return sum(s["queued"] for p, s in g.stats().items() if p in scheduler.PRIORITIES)
+
+
+def enqueue(g, served, priority, sender, label):
+    """Start a waiter that records `label` when it gets the slot, then passes it on."""
+    n = queued(g)
+
+    def run():
+        try:
+            g.acquire(priority, sender)
+        except Overloaded:
+            served.append(f"{label}: rejected")
+            return
+        served.append(label)
+        g.release(0.0)
+
+    t = threading.Thread(target=run)
+    t.start()
+    for _ in range(500):
+        if queued(g) > n:
+            return t
+        time.sleep(0.001)
+    raise AssertionError(f"{label} never queued")
+
+
+def drain(g, threads):
+    g.release(0.0)
+    for t in threads:
+        t.join(2)
+
+
+def test_higher_priority_is_served_first(gate):
+    served = []
+    threads = [enqueue(gate, served, "background", "a", "background"),
+               enqueue(gate, served, "batch", "a", "batch"),
+               enqueue(gate, served, "interactive", "a", "interactive")]
+    drain(gate, threads)
+    assert served == ["interactive", "batch", "background"]
+
+
+def test_senders_are_served_round_robin(gate):
+    served = []
+    threads = [enqueue(gate, served, "batch", "alice", "alice-1"),
+               enqueue(gate, served, "batch", "alice", "alice-2"),
+               enqueue(gate, served, "batch", "alice", "alice-3"),
+               enqueue(gate, served, "batch", "bob", "bob-1")]
+    drain(gate, threads)
+    assert served == ["alice-1", "bob-1", "alice-2", "alice-3"]
+
+
+def test_rejects_when_expected_wait_exceeds_deadline(gate):
+    gate._hold_s = 60.0
+    with pytest.raises(Overloaded) as e:
+        gate.acquire("interactive", "x")
+    assert e.value.retry_after >= scheduler.QUEUE_DEADLINE_S["interactive"]
+    assert gate.stats()["interactive"]["rejected"] == 1
+
+
+def test_timed_out_waiter_hands_slot_to_the_next(gate, monkeypatch):
+    monkeypatch.setitem(scheduler.QUEUE_DEADLINE_S, "interactive", 0.05)
+    served = []
+    early = enqueue(gate, served, "interactive", "a", "times out")
+    late = enqueue(gate, served, "batch", "b", "next")
+    early.join(2)
+    assert served == ["times out: rejected"]
+    drain(gate, [late])
+    assert served[-1] == "next"
+    assert gate.in_use == 0 and queued(gate) == 0
@@ -0,0 +1,184 @@
+# tools/scheduler.py
+"""
+Admission control for the two scarce resources behind every request: LLM
+calls (provider rate limit) and DB executions (the connection pool).
+
+Each is a `Gate`: a bounded semaphore whose waiters are served by priority
+class first (interactive < batch < background) and round-robin across
+senders within a class, so one sender's batch can't starve everyone else.
+A waiter that would blow its class deadline is turned away with
+`Overloaded` (HTTP 429 at the API) instead of timing out later.
+
+The priority and sender travel in context variables set by `admit()`, so
+`LazyAgent.run` and `run_sql` don't need them threaded through every call.
+"""
+from __future__ import annotations
+
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PRIORITIES = ("interactive", "batch", "background")
+# Longest a request of each class may queue for one gate before it is rejected.
+QUEUE_DEADLINE_S = {
+    "interactive": float(os.getenv("QUEUE_DEADLINE_INTERACTIVE_S", "10")),
+    "batch": float(os.getenv("QUEUE_DEADLINE_BATCH_S", "120")),
+    "background": float(os.getenv("QUEUE_DEADLINE_BACKGROUND_S", "600")),
+}
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+DB_CONCURRENCY = int(os.getenv("DB_CONCURRENCY", os.getenv("DB_POOL_SIZE", "5")))
+
+_priority = contextvars.ContextVar("priority", default="interactive")
+_sender = contextvars.ContextVar("sender", default="anonymous")
+
+
+class Overloaded(Exception):
+    """A gate's queue would exceed the caller's deadline; retry after `retry_after` seconds."""
+    def __init__(self, gate: str, priority: str, retry_after: float):
+        self.gate, self.priority, self.retry_after = gate, priority, retry_after
+        super().__init__(f"{gate} overloaded for {priority} requests; retry in ~{retry_after:.0f}s")
+
+
+@contextmanager
+def admit(priority: str = "interactive", sender: str | None = None):
+    """Run the block as `priority` on behalf of `sender` (read by every gate it passes)."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"priority must be one of {PRIORITIES}")
+    t1 = _priority.set(priority)
+    t2 = _sender.set(sender or "anonymous")
+    try:
+        yield
+    finally:
+        _priority.reset(t1)
+        _sender.reset(t2)
+
+
+def call_as(priority: str, sender: str | None, fn, *args, **kwargs):
+    with admit(priority, sender):
+        return fn(*args, **kwargs)
+
+
+def current() -> tuple[str, str]:
+    return _priority.get(), _sender.get()
+
+
+class _Waiter:
+    __slots__ = ("event", "granted")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class Gate:
+    """Priority + per-sender fair semaphore with deadline-based rejection. Thread-safe."""
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self._lock = threading.Lock()
+        self.in_use = 0
+        # priority -> sender -> FIFO of waiters; senders rotate to the back when served
+        self._queues = {p: OrderedDict() for p in PRIORITIES}
+        self._hold_s = 1.0  # EWMA of how long a slot is held
+        self._waits = {p: deque(maxlen=1000) for p in PRIORITIES}
+        self.admitted = {p: 0 for p in PRIORITIES}
+        self.rejected = {p: 0 for p in PRIORITIES}
+
+    def _ahead(self, priority: str) -> int:
+        n = 0
+        for p in PRIORITIES[:PRIORITIES.index(priority) + 1]:
+            n += sum(len(q) for q in self._queues[p].values())
+        return n
+
+    def _next(self) -> _Waiter | None:
+        for p in PRIORITIES:
+            senders = self._queues[p]
+            if senders:
+                sender, q = next(iter(senders.items()))
+                w = q.popleft()
+                del senders[sender]
+                if q:
+                    senders[sender] = q  # back of the line for the next round
+                return w
+        return None
+
+    def _remove(self, priority: str, sender: str, w: _Waiter):
+        q = self._queues[priority].get(sender)
+        if q is not None and w in q:
+            q.remove(w)
+            if not q:
+                del self._queues[priority][sender]
+
+    def acquire(self, priority: str, sender: str):
+        deadline = QUEUE_DEADLINE_S[priority]
+        t0 = time.perf_counter()
+        with self._lock:
+            if self.in_use < self.capacity and not self._ahead("background"):
+                self.in_use += 1
+                self._admit(priority, 0.0)
+                return
+            # Expected wait: everyone ahead of us (same class or better) drains at capacity/hold_s.
+            expected = (self._ahead(priority) + 1) * self._hold_s / self.capacity
+            if expected > deadline:
+                self.rejected[priority] += 1
+                raise Overloaded(self.name, priority, expected)
+            w = _Waiter()
+            self._queues[priority].setdefault(sender, deque()).append(w)
+        w.event.wait(deadline)
+        with self._lock:
+            if not w.granted:
+                self._remove(priority, sender, w)
+                self.rejected[priority] += 1
+                raise Overloaded(self.name, priority, self._hold_s)
+            self._admit(priority, time.perf_counter() - t0)
+
+    def _admit(self, priority: str, waited_s: float):
+        self.admitted[priority] += 1
+        self._waits[priority].append(waited_s)
+
+    def release(self, held_s: float):
+        with self._lock:
+            self._hold_s = 0.9 * self._hold_s + 0.1 * held_s
+            w = self._next()
+            if w is None:
+                self.in_use -= 1
+            else:  # hand the slot straight to the next waiter
+                w.granted = True
+                w.event.set()
+
+    @contextmanager
+    def slot(self, priority: str | None = None, sender: str | None = None):
+        """Hold one slot for the block; priority/sender default to the admit() context."""
+        ctx_priority, ctx_sender = current()
+        priority, sender = priority or ctx_priority, sender or ctx_sender
+        self.acquire(priority, sender)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - t0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = {"capacity": self.capacity, "in_use": self.in_use, "hold_s_ewma": round(self._hold_s, 3)}
+            for p in PRIORITIES:
+                waits = sorted(self._waits[p])
+                pct = lambda q: round(waits[min(len(waits) - 1, int(len(waits) * q))] * 1000, 1) if waits else None
+                out[p] = {"queued": sum(len(q) for q in self._queues[p].values()),
+                          "admitted": self.admitted[p], "rejected": self.rejected[p],
+                          "queue_ms_p50": pct(0.5), "queue_ms_p95": pct(0.95)}
+            return out
+
+
+llm_gate = Gate("llm", LLM_CONCURRENCY)
+db_gate = Gate("db", DB_CONCURRENCY)
+
+def stats() -> dict:
+    return {"llm": llm_gate.stats(), "db": db_gate.stats()}
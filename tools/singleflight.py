@@ -0,0 +1,94 @@
+# tools/singleflight.py
+import re, threading, time
+
+def normalize_message(msg: str) -> str:
+    """Casefold, collapse whitespace and drop trailing punctuation so trivially different texts share a key."""
+    return re.sub(r"\s+", " ", (msg or "").strip().lower()).rstrip(" ?.!")
+
+class _AllCancelled:
+    """Event-like view that is set only once every participant of a coalesced call has cancelled."""
+    def __init__(self, first):
+        self.events = [first]
+        self.uncancellable = False
+
+    def add(self, cancel):
+        if cancel is None:
+            self.uncancellable = True
+        else:
+            self.events.append(cancel)
+
+    def is_set(self) -> bool:
+        return not self.uncancellable and all(e.is_set() for e in self.events)
+
+    def wait(self, timeout: float) -> bool:
+        if not self.is_set():
+            time.sleep(timeout)
+        return self.is_set()
+
+class _Call:
+    __slots__ = ("done", "result", "error", "cancel")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.cancel = None
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key: the first caller runs the
+    function, everyone arriving while it is in flight waits and gets the same
+    result (or exception). Nothing is cached once the call completes.
+
+    If the leader passes `cancel`, the function receives a combined token that
+    only fires when every waiter has cancelled, so one abandoned client never
+    cancels work others are still waiting for.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: dict = {}
+        self.calls = 0
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, cancel=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+                if cancel is not None:
+                    call.cancel = _AllCancelled(cancel)
+                    kwargs["cancel"] = call.cancel
+                self.executed += 1
+            else:
+                if call.cancel is not None:
+                    call.cancel.add(cancel)
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._inflight),
+            }
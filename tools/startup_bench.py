@@ -0,0 +1,69 @@
+# tools/startup_bench.py
+"""
+Startup-time benchmark. Run from the repo root:
+
+    python -m tools.startup_bench [--top 15] [--warm] [--json]
+
+1) `python -X importtime -c "import app"` in a fresh interpreter: total
+   import time plus the slowest modules by cumulative time.
+2) Router() construction and first-use costs per stage (agents, KG, engines),
+   via Router.warm_up() when --warm is given.
+--json prints one line suitable for tracking over time.
+"""
+import argparse, json, os, subprocess, sys, time
+
+def import_profile(module: str = "app"):
+    """Return (total_us, [(cumulative_us, self_us, module), ...]) for importing `module`."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, cwd=os.getcwd())
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else "import failed")
+    rows, total = [], 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        # the name column is "| " + two spaces per nesting level: read depth before stripping
+        if not name[1:].startswith(" "):
+            total += int(cum_us)  # top-level imports partition the whole run
+        rows.append((int(cum_us), int(self_us), name.strip()))
+    return total, rows
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--module", default="app")
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--warm", action="store_true", help="also time Router.warm_up() (needs DBs + model creds)")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    total_us, rows = import_profile(args.module)
+    top = sorted(rows, reverse=True)[:args.top]
+
+    sys.path.insert(0, os.getcwd())
+    t0 = time.perf_counter()
+    from agents.router import Router
+    router = Router()
+    construct_s = time.perf_counter() - t0
+    warm = router.warm_up() if args.warm else {}
+
+    result = {
+        "import_ms": round(total_us / 1000, 1),
+        "router_construct_ms": round(construct_s * 1000, 1),
+        "warm_up_s": warm,
+        "top_imports": [{"module": n.strip(), "cumulative_ms": round(c / 1000, 1), "self_ms": round(s / 1000, 1)}
+                        for c, s, n in top],
+    }
+    if args.json:
+        print(json.dumps(result))
+        return
+    print(f"import {args.module}: {result['import_ms']} ms")
+    print(f"Router(): {result['router_construct_ms']} ms")
+    for k, v in warm.items():
+        print(f"warm_up.{k}: {v}")
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    for r in result["top_imports"]:
+        print(f"{r['cumulative_ms']:>14} {r['self_ms']:>9}  {r['module']}")
+
+if __name__ == "__main__":
+    main()